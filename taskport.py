@@ -1,6 +1,6 @@
 #!/usr/bin/python3
-from flask import Flask, jsonify, render_template_string, request, send_file, abort
-import psutil, time, os, signal, ipaddress, datetime, tempfile, json, threading, collections
+from flask import Flask, jsonify, render_template_string, request, send_file, abort, Response, stream_with_context
+import psutil, time, os, sys, signal, ipaddress, datetime, tempfile, json, threading, collections, random, operator, argparse, bisect, socket, shutil, queue, gzip, struct, array, math, zlib
 
 app = Flask(__name__)
 
@@ -12,16 +12,44 @@ last={}
 first_seen={}
 RULES=[]
 RULE_DEFS={}
+RULE_PLAN={"rules":[],"steps":[],"ordered":True,"cycles":[],"duplicates":[],"opaque":[],"stable_fields":(),"dynamic":(),"volatile":frozenset()}
+RULE_DYNAMIC_FIELDS=("age_s","fanout","tx_bps","rx_bps","tx_bytes","rx_bytes","proc_tx_bps","proc_rx_bps","opens_5m","closes_5m","distinct_rips_5m","interval_jitter")
+RULE_CACHE={}
+RULE_STATS={"hits":0,"partial":0,"full":0}
 LOG_EVENTS=collections.deque(maxlen=4000)
 LOG_ALERT_EVENTS=collections.deque(maxlen=2000)
 EVENT_SEQ=0
+RULES_VERSION=0
 
-def load_rules():
-    global RULES,RULE_DEFS
-    with open(RULES_PATH,"r",encoding="utf-8") as f: obj=json.load(f)
-    rules=obj.get("rules",[]); rules=rules if isinstance(rules,list) else []
+METRIC_BUCKETS_MS=(0.1,0.25,0.5,1,2.5,5,10,25,50,100,250,500,1000,2500,5000)
+METRICS={"stages":{},"counters":collections.Counter()}
+metrics_lock=threading.Lock()
+
+def observe_ms(stage,ms):
+    with metrics_lock:
+        h=METRICS["stages"].get(stage)
+        if h is None: h=METRICS["stages"][stage]=[[0]*(len(METRIC_BUCKETS_MS)+1),0.0,0,0.0]
+        h[0][bisect.bisect_left(METRIC_BUCKETS_MS,ms)]+=1; h[1]+=ms; h[2]+=1; h[3]=max(h[3],ms)
+
+def observe(stage,t0):
+    t=time.perf_counter(); observe_ms(stage,(t-t0)*1000)
+    return t
+
+def count(**kw):
+    with metrics_lock: METRICS["counters"].update(kw)
+
+def install_rules(rules):
+    global RULES,RULE_DEFS,RULE_PLAN,RULES_VERSION
     RULES=[r for r in rules if r.get("enabled",True) and r.get("id")]
     RULE_DEFS={r["id"]:{ "badge":r.get("badge",r["id"]), "severity":int(r.get("severity",1)), "description":r.get("description",{"why":"","fp":"","what":""}) } for r in RULES}
+    RULE_PLAN=compile_rules(RULES); RULE_CACHE.clear(); RULES_VERSION+=1
+    for cyc in RULE_PLAN["cycles"]: print("[taskport] ciclo en reglas: "+" -> ".join(map(str,cyc))+" (se usa evaluación iterativa)",file=sys.stderr)
+    if RULE_PLAN["duplicates"]: print("[taskport] ids de regla duplicados: "+", ".join(map(str,RULE_PLAN["duplicates"]))+" (se usa evaluación iterativa)",file=sys.stderr)
+    if RULE_PLAN["opaque"]: print("[taskport] reglas que leen alerts de forma no analizable: "+", ".join(map(str,RULE_PLAN["opaque"]))+" (se usa evaluación iterativa)",file=sys.stderr)
+
+def load_rules():
+    with open(RULES_PATH,"r",encoding="utf-8") as f: obj=json.load(f)
+    rules=obj.get("rules",[]); install_rules(rules if isinstance(rules,list) else [])
 
 def _is_number(x): return isinstance(x,(int,float)) and not isinstance(x,bool)
 def _cmp(op,a,b):
@@ -77,6 +105,203 @@ def apply_rules_fixpoint(base_ctx):
         if not changed: break
     return alerts
 
+def _never(ctx): return False
+def _hashable(x):
+    try: hash(x); return True
+    except TypeError: return False
+
+def _compile_leaf(cond):
+    field=cond.get("field"); op=cond.get("op"); val=cond.get("value")
+    if field=="alerts":
+        if op=="contains": return ((lambda ctx: val in ctx["alerts"]),{val},False) if _hashable(val) else (_never,set(),False)
+        if op=="contains_any" and isinstance(val,list):
+            ids=tuple(x for x in val if _hashable(x))
+            return (lambda ctx: any(x in ctx["alerts"] for x in ids)),set(ids),False
+        return (lambda ctx: eval_leaf(cond,ctx)),set(),True
+    if op=="eq": return (lambda ctx: ctx.get(field)==val),set(),False
+    if op=="neq": return (lambda ctx: ctx.get(field)!=val),set(),False
+    if op in {"gt","gte","lt","lte"}:
+        if not _is_number(val): return _never,set(),False
+        cmp={"gt":operator.gt,"gte":operator.ge,"lt":operator.lt,"lte":operator.le}[op]
+        def f(ctx):
+            v=ctx.get(field)
+            return _is_number(v) and cmp(v,val)
+        return f,set(),False
+    if op in {"in","not_in"}:
+        if not isinstance(val,list): return _never,set(),False
+        neg=(op=="not_in")
+        try: members=frozenset(val)
+        except TypeError: members=val
+        def f(ctx):
+            try: return (ctx.get(field) in members)!=neg
+            except TypeError: return neg
+        return f,set(),False
+    if op=="starts_with" or op=="ends_with":
+        if not isinstance(val,str): return _never,set(),False
+        def f(ctx):
+            v=ctx.get(field)
+            return isinstance(v,str) and (v.startswith(val) if op=="starts_with" else v.endswith(val))
+        return f,set(),False
+    if op in {"contains","contains_any"}: return (lambda ctx: eval_leaf(cond,ctx)),set(),False
+    return _never,set(),False
+
+def _compile_all(fns):
+    if len(fns)==1: return fns[0]
+    def f(ctx):
+        for g in fns:
+            if not g(ctx): return False
+        return True
+    return f
+
+def _compile_any(fns):
+    if len(fns)==1: return fns[0]
+    def f(ctx):
+        for g in fns:
+            if g(ctx): return True
+        return False
+    return f
+
+def _compile_expr(expr):
+    if not isinstance(expr,dict): return _never,set(),False
+    for key,join in (("all",_compile_all),("any",_compile_any)):
+        if key in expr:
+            items=expr.get(key,[])
+            if not isinstance(items,list): return _never,set(),False
+            parts=[_compile_expr(x) for x in items]
+            return join(tuple(p[0] for p in parts)),set().union(*(p[1] for p in parts)),any(p[2] for p in parts)
+    if "not" in expr:
+        g,deps,opaque=_compile_expr(expr.get("not"))
+        return (lambda ctx: not g(ctx)),deps,opaque
+    if "field" in expr and "op" in expr: return _compile_leaf(expr)
+    return _never,set(),False
+
+def _find_cycles(ids,deps):
+    cycles=[]; state={}; stack=[]
+    def visit(rid):
+        state[rid]=1; stack.append(rid)
+        for d in sorted(deps[rid],key=ids.index):
+            if state.get(d)==1: cycles.append(stack[stack.index(d):]+[d])
+            elif d not in state: visit(d)
+        stack.pop(); state[rid]=2
+    for rid in ids:
+        if rid not in state: visit(rid)
+    return cycles
+
+def _leaves(expr):
+    if not isinstance(expr,dict): return []
+    for key in ("all","any"):
+        if key in expr:
+            items=expr.get(key,[])
+            return [l for x in items for l in _leaves(x)] if isinstance(items,list) else []
+    if "not" in expr: return _leaves(expr.get("not"))
+    if "field" in expr and "op" in expr: return [expr]
+    return []
+
+def _thresholds(leaves,field):
+    ts=set()
+    for c in leaves:
+        if c.get("field")!=field: continue
+        op=c.get("op"); val=c.get("value")
+        if op in {"gt","gte","lt","lte"}: vals=[val] if _is_number(val) else []
+        elif op in {"eq","neq"}: vals=[val]
+        elif op in {"in","not_in"}: vals=val if isinstance(val,list) else []
+        else: return None
+        for x in vals:
+            if isinstance(x,(int,float)):
+                if x!=x: return None
+                ts.add(x)
+    return tuple(sorted(ts))
+
+def _bucket(v,ts):
+    if ts is None or not _is_number(v): return v
+    return (bisect.bisect_left(ts,v),bisect.bisect_right(ts,v))
+
+def compile_rules(rules):
+    compiled=[]; leaves={}
+    for i,r in enumerate(rules):
+        fn,deps,opaque=_compile_expr(r.get("when",{}))
+        compiled.append((r.get("id"),i,fn,tuple(deps),opaque))
+        leaves.setdefault(r.get("id"),[]).extend(_leaves(r.get("when",{})))
+    ids=[c[0] for c in compiled]
+    used={c.get("field") for ls in leaves.values() for c in ls}-{"alerts"}
+    dynamic=[f for f in RULE_DYNAMIC_FIELDS if f in used]
+    plan={"rules":compiled,"steps":[],"ordered":True,"cycles":[],"duplicates":sorted((i for i,n in collections.Counter(ids).items() if n>1),key=str),"opaque":[c[0] for c in compiled if c[4]],"stable_fields":tuple(sorted((f for f in used-set(dynamic) if _hashable(f)),key=str)),
+          "dynamic":tuple((f,_thresholds([c for ls in leaves.values() for c in ls],f)) for f in dynamic),"volatile":frozenset()}
+    if plan["duplicates"] or plan["opaque"]:
+        plan["ordered"]=False; return plan
+    known=set(ids)
+    deps={c[0]:[d for d in c[3] if d in known] for c in compiled}
+    plan["cycles"]=_find_cycles(ids,deps)
+    if plan["cycles"]:
+        plan["ordered"]=False; return plan
+    done=set(); by_id={c[0]:c for c in compiled}
+    def place(rid):
+        if rid in done: return
+        done.add(rid)
+        for d in deps[rid]: place(d)
+        rid,i,fn,_,_=by_id[rid]
+        plan["steps"].append((rid,i,fn,tuple(deps[rid])))
+    for rid in ids: place(rid)
+    volatile=set()
+    for rid,_,_,ds in plan["steps"]:
+        if any(c.get("field") in dynamic for c in leaves[rid]) or volatile.intersection(ds): volatile.add(rid)
+    plan["volatile"]=frozenset(volatile)
+    return plan
+
+def _fire_times(base_ctx,plan,fired=None,only=None):
+    ctx=dict(base_ctx)
+    if not plan["ordered"]:
+        alerts=[]; ctx["alerts"]=alerts
+        for _ in range(max(1,len(plan["rules"]))):
+            changed=False
+            for rid,_,fn,_,_ in plan["rules"]:
+                if rid in alerts: continue
+                if fn(ctx): alerts.append(rid); changed=True
+            if not changed: break
+        return {rid:(n,0) for n,rid in enumerate(alerts)}
+    fired=dict(fired) if fired else {}; ctx["alerts"]=set()
+    for rid,i,fn,deps in plan["steps"]:
+        if only is not None and rid not in only: continue
+        if not deps:
+            if fn(ctx): fired[rid]=(1,i)
+            continue
+        seen=[(d,t[0] if t[1]<i else t[0]+1) for d in deps for t in (fired.get(d),) if t]
+        for k in sorted({1,*(k for _,k in seen)}):
+            ctx["alerts"]={d for d,kd in seen if kd<=k}
+            if fn(ctx): fired[rid]=(k,i); break
+    return fired
+
+def apply_rules(base_ctx,plan=None):
+    fired=_fire_times(base_ctx,plan or RULE_PLAN)
+    return sorted(fired,key=fired.__getitem__)
+
+def _severity(alerts):
+    severity=0
+    for a in alerts:
+        d=RULE_DEFS.get(a)
+        if d: severity=max(severity,int(d.get("severity",1)))
+    return severity
+
+def evaluate_rules(key,base_ctx):
+    plan=RULE_PLAN
+    stable=tuple(base_ctx.get(f) for f in plan["stable_fields"])
+    bucket=tuple(_bucket(base_ctx.get(f),ts) for f,ts in plan["dynamic"])
+    e=RULE_CACHE.get(key)
+    if e and e[0]==stable:
+        if e[1]==bucket:
+            RULE_STATS["hits"]+=1; return e[3],e[4]
+        if plan["ordered"]:
+            RULE_STATS["partial"]+=1; static=e[2]
+            fired=_fire_times(base_ctx,plan,static,plan["volatile"])
+        else:
+            RULE_STATS["full"]+=1; fired=_fire_times(base_ctx,plan); static=None
+    else:
+        RULE_STATS["full"]+=1; fired=_fire_times(base_ctx,plan)
+        static={rid:t for rid,t in fired.items() if rid not in plan["volatile"]}
+    alerts=sorted(fired,key=fired.__getitem__); severity=_severity(alerts)
+    RULE_CACHE[key]=(stable,bucket,static,alerts,severity)
+    return alerts,severity
+
 load_rules()
 
 NET_INTERVAL_S=2.0
@@ -87,12 +312,120 @@ net_hist=collections.deque(maxlen=NET_MAX_POINTS)
 net_marks=collections.deque(maxlen=NET_MAX_POINTS)
 net_lock=threading.Lock()
 _last_net=None
+NET_SEQ=0
+push_cond=threading.Condition()
+PUSH_SEQ=0
+
+def _notify_push():
+    global PUSH_SEQ
+    with push_cond: PUSH_SEQ+=1; push_cond.notify_all()
 
 def now_ts(): return datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+HIST_FLUSH_S=1.0
+HIST_BATCH=1000
+HIST_QUEUE_MAX=50000
+HIST_SEGMENT_BYTES=8*1024*1024
+HIST_SEGMENT_S=3600.0
+HIST_MAX_SEGMENTS=48
+HIST_BLOCK_BYTES=64*1024
+HIST_QUERY_LIMIT=20000
+HIST_QUERY_RETRIES=3
+HIST_STATS={"written":0,"dropped":0,"batches":0,"rotations":0}
+hist_lock=threading.Lock()
+_hist_q=queue.Queue(maxsize=HIST_QUEUE_MAX)
+_hist={"segments":[],"index":[],"size":0,"t0":None,"t1":None,"seq":0}
+
 def _append_tmp(obj):
-    try:
-        with open(NET_TMP_PATH,"a",encoding="utf-8") as f: f.write(json.dumps(obj,ensure_ascii=False)+"\n")
-    except Exception: pass
+    try: _hist_q.put_nowait({"ts":time.time(),**obj})
+    except queue.Full: HIST_STATS["dropped"]+=1
+
+def _hist_write(f,batch):
+    if f is None: f=open(NET_TMP_PATH,"ab")
+    with hist_lock: pos=_hist["size"]; last_ix=_hist["index"][-1][1] if _hist["index"] else None
+    chunks=[]; index=[]
+    for obj in batch:
+        b=(json.dumps(obj,ensure_ascii=False)+"\n").encode("utf-8")
+        if last_ix is None or pos-last_ix>=HIST_BLOCK_BYTES: index.append((obj["ts"],pos)); last_ix=pos
+        chunks.append(b); pos+=len(b)
+    f.write(b"".join(chunks)); f.flush()
+    with hist_lock:
+        _hist["index"].extend(index); _hist["size"]=pos
+        if _hist["t0"] is None: _hist["t0"]=batch[0]["ts"]
+        _hist["t1"]=batch[-1]["ts"]; t0=_hist["t0"]
+    HIST_STATS["written"]+=len(batch); HIST_STATS["batches"]+=1
+    if pos>=HIST_SEGMENT_BYTES or batch[-1]["ts"]-t0>=HIST_SEGMENT_S:
+        f.close(); _hist_rotate(); f=None
+    return f
+
+def _hist_rotate():
+    base=NET_TMP_PATH[:-len(".jsonl")] if NET_TMP_PATH.endswith(".jsonl") else NET_TMP_PATH
+    with hist_lock: seq=_hist["seq"]+1
+    path=f"{base}.{seq:05d}.jsonl.gz"; blocks=[]; t0=t1=None
+    with open(NET_TMP_PATH,"rb") as src, open(path,"wb") as out:
+        def flush(lines,ts):
+            off=out.tell(); out.write(gzip.compress(b"".join(lines),mtime=0)); blocks.append((ts,off,out.tell()))
+        lines=[]; size=0; bts=None
+        for line in src:
+            try: ts=json.loads(line)["ts"]
+            except Exception: continue
+            if bts is None: bts=ts
+            t0=ts if t0 is None else min(t0,ts); t1=ts if t1 is None else max(t1,ts)
+            lines.append(line); size+=len(line)
+            if size>=HIST_BLOCK_BYTES: flush(lines,bts); lines=[]; size=0; bts=None
+        if lines: flush(lines,bts)
+    seg={"path":path,"t0":t0,"t1":t1,"blocks":blocks}
+    with open(f"{base}.{seq:05d}.idx.json","w",encoding="utf-8") as f: json.dump(seg,f)
+    with hist_lock:
+        _hist["segments"].append(seg); _hist.update(index=[],size=0,t0=None,t1=None,seq=seq)
+        old=_hist["segments"][:-HIST_MAX_SEGMENTS] if len(_hist["segments"])>HIST_MAX_SEGMENTS else []
+        del _hist["segments"][:len(old)]
+    os.remove(NET_TMP_PATH); HIST_STATS["rotations"]+=1
+    for o in old:
+        for x in (o["path"],o["path"][:-len(".jsonl.gz")]+".idx.json"):
+            try: os.remove(x)
+            except OSError: pass
+
+def _hist_loop():
+    f=None
+    while True:
+        batch=[_hist_q.get()]; deadline=time.time()+HIST_FLUSH_S
+        while len(batch)<HIST_BATCH:
+            try: batch.append(_hist_q.get(timeout=max(0.0,deadline-time.time())))
+            except queue.Empty: break
+        try: f=_hist_write(f,batch)
+        except Exception:
+            try: f.close()
+            except Exception: pass
+            f=None
+
+def _history_read(segs,ix,size,t_from,t_to,limit):
+    sources=[(sg["path"],True,sg["blocks"]) for sg in segs]
+    if ix: sources.append((NET_TMP_PATH,False,[(ts,pos,ix[i+1][1] if i+1<len(ix) else size) for i,(ts,pos) in enumerate(ix)]))
+    out={"points":[],"marks":[],"truncated":False}; n=0
+    for path,packed,blocks in sources:
+        i=max(0,bisect.bisect_right([b[0] for b in blocks],t_from)-1)
+        try:
+            with open(path,"rb") as f:
+                for ts,start,end in blocks[i:]:
+                    if ts>t_to: break
+                    f.seek(start); data=f.read(end-start)
+                    for line in (gzip.decompress(data) if packed else data).splitlines():
+                        obj=json.loads(line)
+                        if not t_from<=obj.get("ts",0)<=t_to: continue
+                        if n>=limit: out["truncated"]=True; return out
+                        out["points" if obj.get("type")=="net" else "marks"].append(obj); n+=1
+        except (OSError,EOFError,ValueError,zlib.error): continue
+    return out
+
+def history_query(t_from,t_to,limit=HIST_QUERY_LIMIT):
+    for _ in range(HIST_QUERY_RETRIES):
+        with hist_lock:
+            seq=_hist["seq"]; ix=list(_hist["index"]); size=_hist["size"]
+            segs=[sg for sg in _hist["segments"] if sg["t1"] is not None and sg["t1"]>=t_from and sg["t0"]<=t_to]
+        out=_history_read(segs,ix,size,t_from,t_to,limit)
+        with hist_lock:
+            if _hist["seq"]==seq: break
+    return out
 
 def human_rate(bps):
     units=["B/s","KB/s","MB/s","GB/s"]; v=float(max(0.0,bps))
@@ -102,7 +435,7 @@ def human_rate(bps):
     return f"{v:.1f} B/s"
 
 def _net_loop():
-    global _last_net
+    global _last_net,NET_SEQ
     while True:
         try:
             io=psutil.net_io_counters(); t=time.time()
@@ -115,14 +448,13 @@ def _net_loop():
                 _last_net=(io.bytes_sent,io.bytes_recv,t)
                 point={"t":now_ts(),"tx_bps":tx_bps,"rx_bps":rx_bps,"tx":human_rate(tx_bps),"rx":human_rate(rx_bps)}
             with net_lock:
+                NET_SEQ+=1; point["n"]=NET_SEQ
                 net_hist.append(point)
                 idx=len(net_hist)-1
-            _append_tmp({"type":"net","i":idx,**point})
+            _append_tmp({"type":"net","i":idx,**point}); _notify_push()
         except Exception: pass
         time.sleep(NET_INTERVAL_S)
 
-threading.Thread(target=_net_loop,daemon=True).start()
-
 def is_public_ip(ip_str):
     try:
         ip=ipaddress.ip_address(ip_str)
@@ -142,44 +474,325 @@ def kill_process(pid):
         try: os.kill(pid,signal.SIGKILL)
         except Exception: pass
 
+PROC_VOLATILE_S=10.0
+PROC_META={}
+PROC_META_STATS={"hits":0,"misses":0,"refreshes":0,"evictions":0}
+proc_meta_lock=threading.Lock()
+
+def _refresh_volatile(m,now):
+    p=m["proc"]; m["vol_t"]=now; PROC_META_STATS["refreshes"]+=1
+    try:
+        parent=p.parent()
+        m["parent_name"]=parent.name() if parent else ""; m["parent"]=f"{parent.pid}:{m['parent_name']}" if parent else ""
+    except Exception: m["parent_name"]=""; m["parent"]=""
+    try: m["rss_mb"]=round(p.memory_info().rss/(1024*1024),1)
+    except Exception: m["rss_mb"]=None
+    try: m["cpu_percent"]=p.cpu_percent(interval=None)
+    except Exception: m["cpu_percent"]=None
+
+def _exec_changed(m,p):
+    try:
+        if (p.name(),p.uids().real)!=(m["name"],m["uid"]): return True
+    except Exception: pass
+    try: return p.exe()!=m["exe"]
+    except Exception: return False
+
+def proc_meta(pid,now=None,fresh=False):
+    now=time.time() if now is None else now
+    p=psutil.Process(pid); ct=p.create_time()
+    with proc_meta_lock:
+        m=PROC_META.get(pid)
+        due=m is not None and (fresh or now-m["vol_t"]>=PROC_VOLATILE_S)
+        if m and m["create_time"]==ct and not (due and _exec_changed(m,p)): PROC_META_STATS["hits"]+=1
+        else:
+            if m: PROC_META_STATS["evictions"]+=1
+            PROC_META_STATS["misses"]+=1
+            m={"proc":p,"create_time":ct,"vol_t":None}
+            for k,get in (("name",p.name),("user",p.username),("exe",p.exe)):
+                try: m[k]=get()
+                except Exception: m[k]=""
+            try: m["uid"]=p.uids().real
+            except Exception: m["uid"]=None
+            try: m["cmdline"]=" ".join(p.cmdline())
+            except Exception: m["cmdline"]=""
+            PROC_META[pid]=m
+        if fresh or m["vol_t"] is None or now-m["vol_t"]>=PROC_VOLATILE_S: _refresh_volatile(m,now)
+    return m
+
+def prune_proc_meta(active):
+    with proc_meta_lock: stale=[pid for pid in PROC_META if pid not in active]
+    for pid in stale:
+        if psutil.pid_exists(pid): continue
+        with proc_meta_lock:
+            if PROC_META.pop(pid,None): PROC_META_STATS["evictions"]+=1
+
 def proc_info(pid):
-    p=psutil.Process(pid)
-    info={"pid":pid,"name":p.name(),"exe":p.exe(),"cmdline":" ".join(p.cmdline()),"user":p.username(),"status":p.status(),"ppid":p.ppid(),"create_time":p.create_time()}
-    try: parent=p.parent(); info["parent_name"]=parent.name() if parent else ""
-    except Exception: info["parent_name"]=""
-    try: info["cpu_percent"]=p.cpu_percent(interval=None)
-    except Exception: info["cpu_percent"]=None
-    try: info["rss_mb"]=round(p.memory_info().rss/(1024*1024),1)
-    except Exception: info["rss_mb"]=None
-    return info
+    m=proc_meta(pid,fresh=True); p=m["proc"]
+    return {"pid":pid,"name":m["name"],"exe":m["exe"],"cmdline":m["cmdline"],"user":m["user"],"status":p.status(),"ppid":p.ppid(),"create_time":m["create_time"],
+            "parent_name":m["parent_name"],"cpu_percent":m["cpu_percent"],"rss_mb":m["rss_mb"]}
+
+PROC_ROOT="/proc"
+PROC_FULL_RESCAN_S=30.0
+PROC_NET_TABLES=(("tcp",False,True),("tcp6",True,True),("udp",False,False),("udp6",True,False))
+TCP_STATUSES={"01":"ESTABLISHED","02":"SYN_SENT","03":"SYN_RECV","04":"FIN_WAIT1","05":"FIN_WAIT2","06":"TIME_WAIT","07":"CLOSE",
+              "08":"CLOSE_WAIT","09":"LAST_ACK","0A":"LISTEN","0B":"CLOSING","0C":"SYN_RECV"}
+Addr=collections.namedtuple("Addr","ip port")
+Conn=collections.namedtuple("Conn","laddr raddr status pid")
+_fd_index={"pids":{},"inodes":{},"unresolved":set(),"full_t":0.0,"stat_size":None,"scans":0}
+_addr_cache={}
+
+def _decode_addr(s,v6):
+    a=_addr_cache.get(s)
+    if a is not None: return a
+    ip,port=s.split(":"); port=int(port,16); b=bytes.fromhex(ip)
+    if sys.byteorder=="little": b=b"".join(b[i:i+4][::-1] for i in range(0,16,4)) if v6 else b[::-1]
+    a=Addr(socket.inet_ntop(socket.AF_INET6 if v6 else socket.AF_INET,b),port) if port else ()
+    if len(_addr_cache)>200000: _addr_cache.clear()
+    _addr_cache[s]=a
+    return a
+
+def _fd_count(pid):
+    base=f"{PROC_ROOT}/{pid}/fd"
+    if _fd_index["stat_size"] is None:
+        try: me=f"{PROC_ROOT}/self/fd"; n=os.stat(me).st_size; _fd_index["stat_size"]=n>0 and abs(n-len(os.listdir(me)))<=1
+        except OSError: _fd_index["stat_size"]=False
+    return os.stat(base).st_size if _fd_index["stat_size"] else len(os.listdir(base))
+
+def _drop_pid(pid):
+    ent=_fd_index["pids"].pop(pid,None)
+    if not ent: return
+    inodes=_fd_index["inodes"]
+    for ino in ent[1]:
+        owners=inodes.get(ino)
+        if owners:
+            owners.discard(pid)
+            if not owners: del inodes[ino]
+
+def _scan_pid(pid,count):
+    _drop_pid(pid); base=f"{PROC_ROOT}/{pid}/fd"; socks=set()
+    try: fds=os.listdir(base)
+    except OSError: fds=[]
+    for fd in fds:
+        try: link=os.readlink(f"{base}/{fd}")
+        except OSError: continue
+        if link.startswith("socket:["): socks.add(link[8:-1])
+    _fd_index["pids"][pid]=(count,socks); _fd_index["scans"]+=1
+    for ino in socks: _fd_index["inodes"].setdefault(ino,set()).add(pid)
+
+def _refresh_fd_index(wanted):
+    pids=_fd_index["pids"]
+    try: live={int(p) for p in os.listdir(PROC_ROOT) if p.isdigit()}
+    except OSError: live=set()
+    for pid in pids.keys()-live: _drop_pid(pid)
+    for pid in live:
+        try: n=_fd_count(pid)
+        except OSError: n=None
+        ent=pids.get(pid)
+        if ent is None or ent[0]!=n: _scan_pid(pid,n)
+    now=time.time(); inodes=_fd_index["inodes"]
+    missing={i for i in wanted if i!="0" and i not in inodes}
+    if missing-_fd_index["unresolved"] or (missing and now-_fd_index["full_t"]>=PROC_FULL_RESCAN_S):
+        _fd_index["full_t"]=now
+        for pid in live:
+            if pids[pid][0] is not None: _scan_pid(pid,pids[pid][0])
+        missing={i for i in missing if i not in inodes}
+    _fd_index["unresolved"]=missing
+
+def proc_net_connections():
+    rows=[]
+    for name,v6,tcp in PROC_NET_TABLES:
+        path=f"{PROC_ROOT}/net/{name}"
+        if v6 and not os.path.exists(path): continue
+        with open(path,"r",encoding="ascii") as f:
+            f.readline()
+            for line in f:
+                parts=line.split()
+                if len(parts)>=10: rows.append((parts[1],parts[2],parts[3],parts[9],v6,tcp))
+    _refresh_fd_index({r[3] for r in rows})
+    inodes=_fd_index["inodes"]; out=[]
+    for la,ra,st,ino,v6,tcp in rows:
+        owners=inodes.get(ino)
+        out.append(Conn(_decode_addr(la,v6),_decode_addr(ra,v6),TCP_STATUSES.get(st,"NONE") if tcp else "NONE",max(owners) if owners else None))
+    return out
+
+def inet_connections():
+    if sys.platform.startswith("linux") and os.path.exists(f"{PROC_ROOT}/net/tcp"):
+        try: return proc_net_connections()
+        except Exception: pass
+    return psutil.net_connections(kind="inet")
+
+ACCT_WINDOW=4
+ACCT_STATS={"mode":None,"sockets":0,"pids":0,"sample_ms":0.0,"failed_dumps":0}
+NETLINK_SOCK_DIAG=4
+SOCK_DIAG_BY_FAMILY=20
+INET_DIAG_INFO=2
+_acct={"conn":{},"pid":{},"io":{}}
+_ip_cache={}
+
+def _ring(): return [array.array("d",bytes(8*3*ACCT_WINDOW)),0,0]
+
+def _ring_push(r,t,tx,rx):
+    a,head,n=r; i=head*3; a[i]=t; a[i+1]=tx; a[i+2]=rx
+    r[1]=(head+1)%ACCT_WINDOW; r[2]=min(n+1,ACCT_WINDOW)
+
+def _ring_rate(r):
+    a,head,n=r
+    if n<2: return 0,0
+    new=((head-1)%ACCT_WINDOW)*3; old=((head-n)%ACCT_WINDOW)*3; dt=a[new]-a[old]
+    if dt<=0: return 0,0
+    return round(max(0.0,(a[new+1]-a[old+1])/dt)),round(max(0.0,(a[new+2]-a[old+2])/dt))
+
+def _diag_ip(b):
+    ip=_ip_cache.get(b)
+    if ip is None:
+        if len(_ip_cache)>200000: _ip_cache.clear()
+        ip=_ip_cache[b]=socket.inet_ntop(socket.AF_INET if len(b)==4 else socket.AF_INET6,b)
+    return ip
+
+def _diag_dump(family):
+    out={}; alen_ip=4 if family==socket.AF_INET else 16
+    with socket.socket(socket.AF_NETLINK,socket.SOCK_RAW,NETLINK_SOCK_DIAG) as nl:
+        req=struct.pack("=BBBBI",family,socket.IPPROTO_TCP,1<<(INET_DIAG_INFO-1),0,0xFFFFFFFF)+bytes(48)
+        nl.sendall(struct.pack("=IHHII",16+len(req),SOCK_DIAG_BY_FAMILY,0x301,1,0)+req)
+        while True:
+            data=nl.recv(1<<20); off=0
+            while off+16<=len(data):
+                ln,typ=struct.unpack_from("=IH",data,off)
+                if typ==3: return out
+                if typ==2: raise OSError("sock_diag: error de netlink")
+                body=off+16; end=off+ln; sport,dport=struct.unpack_from(">HH",data,body+4); a=body+72
+                while a+4<=end:
+                    alen,atype=struct.unpack_from("=HH",data,a)
+                    if alen<4: break
+                    if atype==INET_DIAG_INFO and alen>=4+136:
+                        rip=_diag_ip(data[body+24:body+24+alen_ip]) if dport else ""
+                        out[(_diag_ip(data[body+8:body+8+alen_ip]),sport,rip,dport)]=struct.unpack_from("=QQ",data,a+4+120)
+                    a+=(alen+3)&~3
+                off+=(ln+3)&~3
+            if not data: return out
+
+def _proc_io(pid):
+    tx=rx=0
+    with open(f"{PROC_ROOT}/{pid}/io","r",encoding="ascii") as f:
+        for line in f:
+            if line.startswith("rchar:"): rx=int(line[6:])
+            elif line.startswith("wchar:"): tx=int(line[6:])
+    return tx,rx
+
+def sample_throughput(conns,now):
+    t0=time.perf_counter(); counters=None
+    if ACCT_STATS["mode"]!="proc_io":
+        try:
+            counters={}
+            for fam in (socket.AF_INET,socket.AF_INET6): counters.update(_diag_dump(fam))
+            ACCT_STATS["mode"]="sock_diag"
+        except (OSError,AttributeError):
+            if ACCT_STATS["mode"]=="sock_diag":
+                ACCT_STATS["failed_dumps"]+=1; ACCT_STATS["sample_ms"]=round((time.perf_counter()-t0)*1000,2)
+                return {},{}
+            counters=None; ACCT_STATS["mode"]="proc_io"
+    prev_conn=_acct["conn"]; prev_pid=_acct["pid" if counters is not None else "io"]; conn_out={}; pid_out={}; cur_conn={}; cur_pid={}
+    if counters is not None:
+        for c in conns:
+            if not c.laddr or not c.pid: continue
+            k=(c.laddr.ip,c.laddr.port,c.raddr.ip if c.raddr else "",c.raddr.port if c.raddr else 0)
+            tot=counters.get(k)
+            if tot is None or k in cur_conn: continue
+            ent=prev_conn.get(k)
+            if ent is None or ent[1]!=c.pid: ent=(_ring(),c.pid,0,0)
+            p=cur_pid.get(c.pid) or prev_pid.get(c.pid) or [_ring(),0,0,None]
+            p[1]+=max(0,tot[0]-ent[2]); p[2]+=max(0,tot[1]-ent[3]); cur_pid[c.pid]=p
+            _ring_push(ent[0],now,tot[0],tot[1]); cur_conn[k]=(ent[0],c.pid,tot[0],tot[1])
+            conn_out[k]=_ring_rate(ent[0])+tuple(tot)
+    else:
+        for pid in {c.pid for c in conns if c.pid}:
+            try: tx,rx=_proc_io(pid)
+            except (OSError,ValueError): continue
+            p=prev_pid.get(pid) or [_ring(),tx,rx,None]; p[1]=tx; p[2]=rx; cur_pid[pid]=p
+    for pid,p in cur_pid.items():
+        if p[3]!=now: _ring_push(p[0],now,p[1],p[2]); p[3]=now
+        pid_out[pid]=_ring_rate(p[0])+(p[1],p[2])
+    _acct["conn"]=cur_conn; _acct["pid" if counters is not None else "io"]=cur_pid
+    ACCT_STATS.update(sockets=len(cur_conn),pids=len(cur_pid),sample_ms=round((time.perf_counter()-t0)*1000,2))
+    return conn_out,pid_out
+
+TEMPORAL_WINDOW_S=300.0
+TEMPORAL_MAX_EVENTS=200000
+def _tw_new():
+    return {"t":array.array("d",bytes(8*TEMPORAL_MAX_EVENTS)),"pid":array.array("q",bytes(8*TEMPORAL_MAX_EVENTS)),"kind":array.array("b",bytes(TEMPORAL_MAX_EVENTS)),
+            "gap":array.array("d",bytes(8*TEMPORAL_MAX_EVENTS)),"next":array.array("q",[-1])*TEMPORAL_MAX_EVENTS,"rip":[None]*TEMPORAL_MAX_EVENTS,
+            "head":0,"size":0,"pids":{},"pairs":{},"seeded":False}
+
+_tw=_tw_new()
+
+def _tw_evict():
+    tw=_tw; i=tw["head"]; pid=tw["pid"][i]; rip=tw["rip"][i]; agg=tw["pids"][pid]
+    if tw["kind"][i]:
+        agg[0]-=1
+        if rip:
+            agg[2][rip]-=1
+            if not agg[2][rip]: del agg[2][rip]
+        pair=tw["pairs"][(pid,rip)]; j=tw["next"][i]
+        if j>=0: g=tw["gap"][j]; pair[1]-=1; pair[2]-=g; pair[3]-=g*g
+        if pair[0]==i: del tw["pairs"][(pid,rip)]
+    else: agg[1]-=1
+    if not agg[0] and not agg[1]: del tw["pids"][pid]
+    tw["rip"][i]=None; tw["head"]=(i+1)%TEMPORAL_MAX_EVENTS; tw["size"]-=1
+
+def temporal_record(opened,pid,rip,t):
+    tw=_tw
+    if tw["size"]==TEMPORAL_MAX_EVENTS: _tw_evict()
+    i=(tw["head"]+tw["size"])%TEMPORAL_MAX_EVENTS
+    tw["t"][i]=t; tw["pid"][i]=pid; tw["kind"][i]=1 if opened else 0; tw["rip"][i]=rip; tw["gap"][i]=0.0; tw["next"][i]=-1
+    agg=tw["pids"].get(pid)
+    if agg is None: agg=tw["pids"][pid]=[0,0,{}]
+    if opened:
+        agg[0]+=1
+        if rip: agg[2][rip]=agg[2].get(rip,0)+1
+        pair=tw["pairs"].get((pid,rip))
+        if pair is None: tw["pairs"][(pid,rip)]=[i,0,0.0,0.0]
+        else:
+            prev=pair[0]; d=t-tw["t"][prev]; tw["gap"][i]=d; tw["next"][prev]=i
+            pair[0]=i; pair[1]+=1; pair[2]+=d; pair[3]+=d*d
+    else: agg[1]+=1
+    tw["size"]+=1
+
+def temporal_advance(now):
+    tw=_tw; cutoff=now-TEMPORAL_WINDOW_S
+    while tw["size"] and tw["t"][tw["head"]]<cutoff: _tw_evict()
+
+def temporal_features(pid,rip):
+    agg=_tw["pids"].get(pid); pair=_tw["pairs"].get((pid,rip)); jitter=None
+    if pair and pair[1]>=2:
+        mean=pair[2]/pair[1]
+        if mean>0: jitter=round(math.sqrt(max(0.0,pair[3]/pair[1]-mean*mean))/mean,3)
+    return (agg[0],agg[1],len(agg[2]),jitter) if agg else (0,0,0,jitter)
 
 def snapshot():
-    now=time.time(); data={}; per_pid_total={}
-    for c in psutil.net_connections(kind="inet"):
+    now=time.time(); data={}; per_pid_total={}; t0=t=time.perf_counter()
+    conns=inet_connections(); t=observe("connections",t)
+    for c in conns:
         if not c.laddr or not c.pid: continue
         per_pid_total[c.pid]=per_pid_total.get(c.pid,0)+1
     proc_cache={}
     for pid in per_pid_total.keys():
-        try:
-            p=psutil.Process(pid)
-            name=p.name(); user=p.username(); exe=p.exe()
-            try:
-                parent=p.parent()
-                parent_txt=f"{parent.pid}:{parent.name()}" if parent else ""
-            except Exception:
-                parent_txt=""
-            try:
-                rss_mb=round(p.memory_info().rss/(1024*1024),1)
-            except Exception:
-                rss_mb=None
-            proc_cache[pid]={"name":name,"user":user,"exe":exe,"rss_mb":rss_mb,"parent":parent_txt}
-        except Exception:
-            proc_cache[pid]={"name":"","user":"","exe":"","rss_mb":None,"parent":""}
+        try: proc_cache[pid]=proc_meta(pid,now)
+        except Exception: proc_cache[pid]={"name":"","user":"","exe":"","rss_mb":None,"parent":""}
+    prune_proc_meta(per_pid_total); t=observe("proc_meta",t)
+    conn_io,pid_io=sample_throughput(conns,now); t=observe("throughput",t)
+    temporal_advance(now); fresh=set()
+    for c in conns:
+        if not c.laddr or not c.pid: continue
+        key=(c.laddr.ip,c.laddr.port,c.pid,c.raddr.ip if c.raddr else "",c.raddr.port if c.raddr else 0)
+        if _tw["seeded"] and key not in first_seen and key not in fresh: fresh.add(key); temporal_record(True,c.pid,key[3],now)
+    _tw["seeded"]=True
+    t=observe("temporal",t); rules_s=0.0; evals=RULE_STATS["full"]+RULE_STATS["partial"]
 
-    for c in psutil.net_connections(kind="inet"):
+    for c in conns:
         if not c.laddr or not c.pid: continue
         r_ip=c.raddr.ip if c.raddr else ""; r_port=c.raddr.port if c.raddr else 0
         is_self=(c.laddr.port==SELF_PORT) or (r_port==SELF_PORT)
+        cio=conn_io.get((c.laddr.ip,c.laddr.port,r_ip,r_port),(None,)*4); pio=pid_io.get(c.pid,(None,)*4); tf=temporal_features(c.pid,r_ip)
         key=(c.laddr.ip,c.laddr.port,c.pid,r_ip,r_port)
         pi=proc_cache.get(c.pid,{"name":"","user":"","exe":"","rss_mb":None,"parent":""})
         name=pi.get("name",""); user=pi.get("user",""); exe=pi.get("exe",""); rss_mb=pi.get("rss_mb",None); parent_txt=pi.get("parent","")
@@ -190,16 +803,17 @@ def snapshot():
         exe_standard=bool(exe) and exe.startswith(STANDARD_EXE_PREFIXES)
         base_ctx={"pid":int(c.pid),"name":name,"user":user,"exe_path":exe or "","exe_missing":bool(exe_missing),"exe_standard":bool(exe_standard),
                   "lip":c.laddr.ip,"port":int(c.laddr.port),"rip":r_ip,"rport":int(r_port),"status":status,"dir":direction,
-                  "age_s":age_s,"fanout":int(per_pid_total.get(c.pid,0)),"self":bool(is_self),"ip_publica":bool(r_ip and is_public_ip(r_ip))}
-        alerts=apply_rules_fixpoint(base_ctx)
-        severity=0
-        for a in alerts:
-            d=RULE_DEFS.get(a)
-            if d: severity=max(severity,int(d.get("severity",1)))
-        data[key]={"lip":base_ctx["lip"],"port":base_ctx["port"],"pid":base_ctx["pid"],"name":base_ctx["name"] or "(?)","parent":parent_txt,
+                  "age_s":age_s,"fanout":int(per_pid_total.get(c.pid,0)),"self":bool(is_self),"ip_publica":bool(r_ip and is_public_ip(r_ip)),
+                  "tx_bps":cio[0],"rx_bps":cio[1],"tx_bytes":cio[2],"rx_bytes":cio[3],"proc_tx_bps":pio[0],"proc_rx_bps":pio[1],
+                  "opens_5m":tf[0],"closes_5m":tf[1],"distinct_rips_5m":tf[2],"interval_jitter":tf[3]}
+        tr=time.perf_counter(); alerts,severity=evaluate_rules(key,base_ctx); rules_s+=time.perf_counter()-tr
+        data[key]={"k":f"{c.laddr.ip}|{c.laddr.port}|{c.pid}|{r_ip}|{r_port}","first_seen":first_seen[key],"lip":base_ctx["lip"],"port":base_ctx["port"],"pid":base_ctx["pid"],"name":base_ctx["name"] or "(?)","parent":parent_txt,
                    "status":base_ctx["status"],"rip":base_ctx["rip"],"rport":base_ctx["rport"],"dir":base_ctx["dir"],"age_txt":fmt_age(age_s),
                    "user":base_ctx["user"] or "(?)","exe":base_ctx["exe_path"],"exe_short":short_path(base_ctx["exe_path"]),
-                   "alerts":alerts,"self":base_ctx["self"],"severity":severity,"rss_mb":rss_mb}
+                   "alerts":alerts,"self":base_ctx["self"],"severity":severity,"rss_mb":rss_mb,
+                   "tx_bps":cio[0],"rx_bps":cio[1],"tx_bytes":cio[2],"rx_bytes":cio[3],"proc_tx_bps":pio[0],"proc_rx_bps":pio[1],"proc_tx_bytes":pio[2],"proc_rx_bytes":pio[3]}
+    observe_ms("rules",rules_s*1000); t=observe("rows",t); observe("snapshot",t0)
+    count(polls=1,rows=len(data),pids=len(per_pid_total),rule_evals=RULE_STATS["full"]+RULE_STATS["partial"]-evals)
     return data
 
 def _push_event(kind,row,t,idx):
@@ -209,34 +823,127 @@ def _push_event(kind,row,t,idx):
         "rip":row.get("rip"),"rport":row.get("rport"),"status":row.get("status"),"alerts":row.get("alerts") or []}
     LOG_EVENTS.append(ev)
     if ev["alerts"]: LOG_ALERT_EVENTS.append(ev)
-    m={"i":idx,"color":"#00ff00" if kind=="OPEN" else "#ff4444","t":t,"kind":"open" if kind=="OPEN" else "close",
+    m={"i":idx,"n":net_hist[-1]["n"] if net_hist else 0,"id":EVENT_SEQ,"color":"#00ff00" if kind=="OPEN" else "#ff4444","t":t,"kind":"open" if kind=="OPEN" else "close",
        "pid":ev["pid"],"name":ev["name"],"port":ev["port"],"rip":ev["rip"],"rport":ev["rport"],"status":ev["status"],"ev":kind}
     net_marks.append(m); _append_tmp({"type":"mark",**m})
 
-@app.route("/api/state")
-def api_state():
-    global last
-    cur=snapshot()
+STATE_INTERVAL_S=2.0
+STATE_DELTA_KEEP=30
+STREAM_KEEPALIVE_S=15.0
+state_lock=threading.Lock()
+STATE={"version":0,"time":now_ts(),"ports":(),"opened":(),"closed":()}
+STATE_DELTAS=collections.deque(maxlen=STATE_DELTA_KEEP)
+_last_sigs={}
+
+def _row_sig(row): return tuple(v for k,v in row.items() if k!="age_txt")
+
+def collect_state():
+    global last,STATE,_last_sigs
+    cur=snapshot(); tp=time.perf_counter()
     opened_keys=cur.keys()-last.keys()
     closed_keys=last.keys()-cur.keys()
-    for k in closed_keys: first_seen.pop(k,None)
-    opened=[cur[k] for k in opened_keys if not cur[k].get("self")]
-    closed=[last[k] for k in closed_keys if not last[k].get("self")]
-    ports=sorted(cur.values(),key=lambda x:(-x["severity"],x["port"],x["pid"],x["rip"],x["rport"]))
+    t_close=time.time()
+    for k in closed_keys: first_seen.pop(k,None); RULE_CACHE.pop(k,None); temporal_record(False,k[2],k[3],t_close)
+    opened=tuple(cur[k] for k in opened_keys if not cur[k].get("self"))
+    closed=tuple(last[k] for k in closed_keys if not last[k].get("self"))
+    ports=tuple(sorted(cur.values(),key=lambda x:(-x["severity"],x["port"],x["pid"],x["rip"],x["rport"]))); tp=observe("sort",tp)
+    sigs={k:_row_sig(r) for k,r in cur.items()}
+    delta={"added":tuple(cur[k] for k in opened_keys),"removed":tuple(last[k]["k"] for k in closed_keys),
+           "changed":tuple(cur[k] for k in cur.keys()&last.keys() if sigs[k]!=_last_sigs.get(k))}
     t=now_ts()
     with net_lock:
-        hist=list(net_hist)
-        idx=len(hist)-1 if hist else 0
+        idx=len(net_hist)-1 if net_hist else 0
         for o in opened: _push_event("OPEN",o,t,idx)
         for c in closed: _push_event("CLOSE",c,t,idx)
-        marks=list(net_marks)
-    net={"tx_bps":0.0,"rx_bps":0.0,"tx":"0.0 B/s","rx":"0.0 B/s"} if not hist else {"tx_bps":float(hist[-1].get("tx_bps",0.0)),
+    last=cur; _last_sigs=sigs
+    with state_lock:
+        STATE={"version":STATE["version"]+1,"time":t,"ports":ports,"opened":opened,"closed":closed}
+        delta["version"]=STATE["version"]; STATE_DELTAS.append(delta)
+    observe("diff",tp); _notify_push()
+    return STATE
+
+def _state_loop():
+    while True:
+        t0=time.time()
+        try: collect_state()
+        except Exception: pass
+        time.sleep(max(0.0,STATE_INTERVAL_S-(time.time()-t0)))
+
+_bg_lock=threading.Lock()
+_bg_started=False
+
+def start_background():
+    global _bg_started
+    with _bg_lock:
+        if _bg_started: return
+        _bg_started=True
+    threading.Thread(target=_hist_loop,daemon=True).start()
+    threading.Thread(target=_net_loop,daemon=True).start()
+    threading.Thread(target=_state_loop,daemon=True).start()
+
+@app.before_request
+def _ensure_background(): start_background()
+
+def _net_summary(hist):
+    return {"tx_bps":0.0,"rx_bps":0.0,"tx":"0.0 B/s","rx":"0.0 B/s"} if not hist else {"tx_bps":float(hist[-1].get("tx_bps",0.0)),
         "rx_bps":float(hist[-1].get("rx_bps",0.0)),"tx":hist[-1].get("tx","0.0 B/s"),"rx":hist[-1].get("rx","0.0 B/s")}
-    last=cur
+
+def state_delta(v,since,h,rv):
+    t0=time.perf_counter()
+    with state_lock: st=STATE; deltas=[d for d in STATE_DELTAS if d["version"]>v]
+    out={"version":st["version"],"time":st["time"],"now":time.time(),"rules_version":RULES_VERSION}
+    if v<=0 or v>st["version"] or (deltas and deltas[0]["version"]!=v+1):
+        out.update(full=True,ports=st["ports"],added=(),removed=(),changed=())
+    else:
+        rows={}; first={}; removed=set()
+        for d in deltas:
+            for op in ("added","changed"):
+                for r in d[op]: rows[r["k"]]=r; first.setdefault(r["k"],op); removed.discard(r["k"])
+            for k in d["removed"]: rows.pop(k,None); first.setdefault(k,"removed"); removed.add(k)
+        out.update(full=False,added=[r for k,r in rows.items() if first[k]=="added"],changed=[r for k,r in rows.items() if first[k]!="added"],removed=sorted(removed))
+    with net_lock:
+        out["net_reset"]=bool(net_hist) and net_hist[0]["n"]>h+1
+        out["net_history"]=[p for p in net_hist if p["n"]>h]
+        out["net_marks"]=[m for m in net_marks if m["id"]>since]
+        out["events"]=[e for e in LOG_EVENTS if e["id"]>since]
+        out["alert_events"]=[e for e in LOG_ALERT_EVENTS if e["id"]>since]
+        out["net"]=_net_summary(net_hist)
+    if rv!=RULES_VERSION: out["alert_definitions"]=RULE_DEFS
+    observe("delta",t0)
+    return out
+
+def _json_response(obj):
+    t0=time.perf_counter(); body=app.json.dumps(obj)+"\n"; observe("encode",t0); count(responses=1,payload_bytes=len(body))
+    return app.response_class(body,mimetype=app.json.mimetype)
+
+def _cursor_args(args):
+    return tuple(int(args.get(k,"0") or "0") for k in ("v","since","h","rv"))
+
+@app.route("/api/state")
+def api_state():
+    if "v" in request.args: return _json_response(state_delta(*_cursor_args(request.args)))
+    with state_lock: st=STATE
     since=int(request.args.get("since","0") or "0")
-    evs=[e for e in list(LOG_EVENTS) if int(e.get("id",0))>since]
-    aevs=[e for e in list(LOG_ALERT_EVENTS) if int(e.get("id",0))>since]
-    return jsonify({"ports":ports,"opened":opened,"closed":closed,"events":evs,"alert_events":aevs,"time":t,"net":net,"net_history":hist,"net_marks":marks,"net_tmp":NET_TMP_PATH,"alert_definitions":RULE_DEFS})
+    with net_lock:
+        hist=list(net_hist); marks=list(net_marks)
+        evs=[e for e in LOG_EVENTS if int(e.get("id",0))>since]
+        aevs=[e for e in LOG_ALERT_EVENTS if int(e.get("id",0))>since]
+    return _json_response({"version":st["version"],"ports":st["ports"],"opened":st["opened"],"closed":st["closed"],"events":evs,"alert_events":aevs,"time":st["time"],"net":_net_summary(hist),"net_history":hist,"net_marks":marks,"net_tmp":NET_TMP_PATH,"alert_definitions":RULE_DEFS})
+
+@app.route("/api/stream")
+def api_stream():
+    def gen(v,since,h,rv):
+        while True:
+            with push_cond: seen=PUSH_SEQ
+            d=state_delta(v,since,h,rv)
+            v=d["version"]; rv=d["rules_version"]
+            if d["events"]: since=d["events"][-1]["id"]
+            if d["net_history"]: h=d["net_history"][-1]["n"]
+            t0=time.perf_counter(); msg="data: "+json.dumps(d,ensure_ascii=False)+"\n\n"; observe("encode",t0); count(responses=1,payload_bytes=len(msg))
+            yield msg
+            with push_cond: woke=push_cond.wait_for(lambda: PUSH_SEQ!=seen,timeout=STREAM_KEEPALIVE_S)
+            if not woke: yield ": ping\n\n"
+    return Response(stream_with_context(gen(*_cursor_args(request.args))),mimetype="text/event-stream",headers={"Cache-Control":"no-cache","X-Accel-Buffering":"no"})
 
 @app.route("/api/kill",methods=["POST"])
 def api_kill(): kill_process(int(request.json["pid"])); return {"ok":True}
@@ -244,18 +951,200 @@ def api_kill(): kill_process(int(request.json["pid"])); return {"ok":True}
 @app.route("/api/info/<int:pid>")
 def api_info(pid): return proc_info(pid)
 
+def _parse_time(v,default):
+    if v is None or v=="": return default
+    try: return float(v)
+    except ValueError: return datetime.datetime.fromisoformat(v).timestamp()
+
+@app.route("/api/history")
+def api_history():
+    try:
+        t_to=_parse_time(request.args.get("to"),time.time()); t_from=_parse_time(request.args.get("from"),t_to-3600)
+        limit=min(HIST_QUERY_LIMIT,int(request.args.get("limit",HIST_QUERY_LIMIT)))
+    except ValueError: abort(400)
+    return jsonify({"from":t_from,"to":t_to,**history_query(t_from,t_to,limit)})
+
+@app.route("/api/metrics")
+def api_metrics():
+    with metrics_lock:
+        stages={name:{"count":n,"sum_ms":round(sm,3),"avg_ms":round(sm/n,3) if n else 0.0,"max_ms":round(mx,3),
+                      "buckets":{f"le_{b}":c for b,c in zip(METRIC_BUCKETS_MS+("inf",),counts)}} for name,(counts,sm,n,mx) in METRICS["stages"].items()}
+        counters=dict(METRICS["counters"])
+    return jsonify({"stages":stages,"counters":counters})
+
+@app.route("/api/stats")
+def api_stats():
+    with proc_meta_lock: pm={**PROC_META_STATS,"size":len(PROC_META)}
+    return jsonify({"proc_meta":pm,"rules":{**RULE_STATS,"size":len(RULE_CACHE)},"fd_index":{"pids":len(_fd_index["pids"]),"inodes":len(_fd_index["inodes"]),"scans":_fd_index["scans"]},
+                    "throughput":ACCT_STATS,"temporal":{"events":_tw["size"],"pids":len(_tw["pids"]),"pairs":len(_tw["pairs"])},"history":{**HIST_STATS,"queued":_hist_q.qsize(),"segments":len(_hist["segments"])}})
+
 @app.route("/new.wav")
 def new_wav():
     path=os.path.join(os.path.dirname(os.path.abspath(__file__)),"new.wav")
     if not os.path.exists(path): abort(404)
     return send_file(path,mimetype="audio/wav")
 
-HTML=r"""<!doctype html><html><head><meta charset="utf-8"><title>Taskport</title><style>body{background:#0d0d0d;color:#eee;font-family:system-ui;font-size:12px;margin:10px}.header{display:flex;align-items:center;gap:10px;margin-bottom:6px}h2{margin:0;font-size:16px}.tag{padding:2px 8px;border-radius:999px;font-size:11px;border:1px solid transparent}.tag.tx{color:#0ff;border-color:#0ff}.tag.rx{color:#ff9ecb;border-color:#ff9ecb}#netWrap{position:relative;margin-bottom:8px}#netChart{width:100%;height:100px;background:#000;border:1px solid #222;display:block}#tip{position:absolute;display:none;pointer-events:none;background:#000;border:1px solid #333;color:#eee;font:11px ui-monospace,monospace;padding:4px 6px;white-space:pre}table{width:100%;border-collapse:collapse;table-layout:fixed}th,td{text-align:left;padding:2px 6px;border-bottom:1px solid #222;white-space:nowrap;overflow:hidden;text-overflow:ellipsis}th{background:#1a1a1a;font-weight:600}tr.new{background:#444;animation:fade 1.5s forwards}@keyframes fade{to{background:#0d0d0d}}tr.sev3 td{border-left:3px solid #a55}tr.sev2 td{border-left:3px solid #7a4}td.dirCell{position:relative;padding-left:10px}td.dirCell::before{content:"";position:absolute;left:0;top:0;bottom:0;width:4px;background:#666}td.dir-out::before{background:#0ff}td.dir-in::before{background:#ff9ecb}td.dir-listen::before{background:#666}.badge{display:inline-block;padding:1px 6px;border:1px solid #333;border-radius:999px;font-size:11px;cursor:pointer;margin-right:4px;user-select:none}.badge.warn{border-color:#7a4;color:#cfc}.badge.alert{border-color:#a55;color:#fbb}.badge.info{border-color:#5fa9ff;color:#b7dcff}.status-LISTEN{color:#7fdfff}.status-ESTABLISHED{color:#7fff7f}.status-CLOSE_WAIT,.status-TIME_WAIT{color:#ffbf7f}.status-SYN_SENT,.status-SYN_RECV{color:#ffd27f}button{background:#333;color:#eee;border:none;padding:2px 6px;border-radius:6px}button:hover{background:#444}#log,#alertlog{height:160px;background:#000;font-family:ui-monospace,SFMono-Regular,Menlo,Monaco,Consolas,"Liberation Mono",monospace;font-size:11px;line-height:1.35;overflow:auto;white-space:pre;border:1px solid #222;padding:6px}#log{color:#0ff}#alertlog{color:#ff9800}.modal{position:fixed;inset:0;background:rgba(0,0,0,.7);display:none;align-items:center;justify-content:center;z-index:999}.modal-content{background:#111;padding:14px;width:min(920px,92vw);border:1px solid #222;border-radius:12px}pre{margin:0;overflow:auto;max-height:70vh;font-size:12px}.box{border:1px solid #222;border-radius:10px;padding:10px;margin:8px 0;background:#0f0f0f}.label{color:#aaa;font-size:11px;margin-bottom:4px}a.remoteLink{color:#b7dcff;text-decoration:none;border-bottom:1px dotted #5fa9ff}a.remoteLink:hover{border-bottom:1px solid #5fa9ff}.userRoot{color:#ffeb3b}</style></head><body><div class="header"><h2>Taskport</h2><span class="tag tx" id="txLbl">TX 0.0 B/s</span><span class="tag rx" id="rxLbl">RX 0.0 B/s</span></div><div id="netWrap"><canvas id="netChart"></canvas><div id="tip"></div></div><table><thead><tr><th style="width:48px">LPort</th><th style="width:58px">PID</th><th style="width:64px">RSS</th><th style="width:140px">Proceso</th><th style="width:160px">Padre</th><th style="width:190px">Remoto</th><th style="width:56px">Dir</th><th style="width:108px">Estado</th><th style="width:66px">Age</th><th style="width:140px">Usuario</th><th style="width:260px">Exe</th><th style="width:240px">Alertas</th><th style="width:116px">Acción</th></tr></thead><tbody id="rows"></tbody></table><h3 style="margin:10px 0 6px 0;font-size:14px">Log</h3><div id="log"></div><h3 style="margin:10px 0 6px 0;font-size:14px">Log alertas</h3><div id="alertlog"></div><div style="display:flex;gap:8px;align-items:center;margin-top:8px"><button onclick="unlock()">Activar sonido</button><audio id="snd" src="/new.wav"></audio></div><div class="modal" id="infoModal"><div class="modal-content"><pre id="infoText"></pre><div style="margin-top:10px;display:flex;gap:8px;justify-content:flex-end"><button onclick="hideInfo()">Cerrar</button></div></div></div><div class="modal" id="alertModal"><div class="modal-content"><h3 id="a_title" style="margin:0 0 8px 0;font-size:14px"></h3><div class="box"><div class="label">Por qué es sospechoso</div><div id="a_why"></div></div><div class="box"><div class="label">Falsos positivos típicos</div><div id="a_fp"></div></div><div class="box"><div class="label">Qué mirar (rápido)</div><div id="a_what"></div></div><div style="margin-top:10px;display:flex;gap:8px;justify-content:flex-end"><button onclick="hideAlert()">Cerrar</button></div></div></div><script>let unlocked=false,ALERT_DEFS={},hist=[],marks=[],procColors=Object.create(null),lastEventId=0;const $=s=>document.querySelector(s),snd=$("#snd"),canvas=$("#netChart"),ctx=canvas.getContext("2d"),tip=$("#tip");const randColor=()=>`hsl(${Math.floor(Math.random()*360)},90%,70%)`,colorFor=n=>procColors[n]||(procColors[n]=randColor());function unlock(){snd.play().catch(()=>{});unlocked=true}function resize(){canvas.width=canvas.clientWidth;canvas.height=canvas.clientHeight}addEventListener("resize",resize);resize();function drawChart(){ctx.clearRect(0,0,canvas.width,canvas.height);if(!hist.length)return;const tx=hist.map(p=>p.tx_bps||0),rx=hist.map(p=>p.rx_bps||0),ts=hist.map(p=>p.t||"");const max=Math.max(1,...tx,...rx),sx=canvas.width/Math.max(1,hist.length-1),sy=canvas.height/max;const line=(arr,color)=>{if(!arr.length)return;ctx.beginPath();ctx.strokeStyle=color;ctx.lineWidth=1.5;arr.forEach((v,i)=>{const x=i*sx,y=canvas.height-(v*sy);i?ctx.lineTo(x,y):ctx.moveTo(x,y)});ctx.stroke()};line(tx,"#0ff");line(rx,"#ff9ecb");marks.forEach(m=>{if(m.i<0||m.i>=hist.length)return;const x=m.i*sx;ctx.strokeStyle=m.color||"#666";ctx.lineWidth=1;ctx.beginPath();ctx.moveTo(x,0);ctx.lineTo(x,canvas.height);ctx.stroke()});ctx.fillStyle="#666";ctx.font="10px ui-monospace,monospace";for(let i=0;i<ts.length;i++)if(i%30===0){const x=i*sx;ctx.save();ctx.translate(x,canvas.height-2);ctx.rotate(-Math.PI/4);ctx.fillText(ts[i],0,0);ctx.restore()}}function idxFromMouse(ev){if(!hist.length)return-1;const r=canvas.getBoundingClientRect(),x=ev.clientX-r.left;const i=Math.round(x/canvas.width*(hist.length-1));return i<0||i>=hist.length?-1:i}function evLine(m){const k=m.ev==="OPEN"||m.kind==="open"?"ABRE":"CIERRA";const r=m.rip?`${m.rip}:${m.rport}`:"(local)";return`${m.t} ${k} LPort ${m.port} PID ${m.pid} ${m.name||"(?)"} -> ${r}`}canvas.addEventListener("mousemove",ev=>{const i=idxFromMouse(ev);if(i<0){tip.style.display="none";return}const tx=hist[i].tx_bps||0,rx=hist[i].rx_bps||0,t=hist[i].t||"";const sx=canvas.width/Math.max(1,hist.length-1),x=i*sx;const evs=marks.filter(m=>m.i===i);const extra=evs.length?"\n"+evs.map(evLine).join("\n"):"";tip.style.display="block";tip.style.left=x+8+"px";tip.style.top="10px";tip.textContent=`${t}\nTX ${tx.toFixed(1)} B/s  RX ${rx.toFixed(1)} B/s${extra}`;drawChart();const max=Math.max(1,...hist.map(p=>p.tx_bps||0),...hist.map(p=>p.rx_bps||0)),sy=canvas.height/max;ctx.fillStyle="#0ff";ctx.beginPath();ctx.arc(x,canvas.height-(tx*sy),2.5,0,Math.PI*2);ctx.fill();ctx.fillStyle="#ff9ecb";ctx.beginPath();ctx.arc(x,canvas.height-(rx*sy),2.5,0,Math.PI*2);ctx.fill()});canvas.addEventListener("mouseleave",()=>{tip.style.display="none";drawChart()});function logLine(s){const d=$("#log");d.textContent+=s+"\n";d.scrollTop=d.scrollHeight}function alertLogLine(s){const d=$("#alertlog");d.textContent+=s+"\n";d.scrollTop=d.scrollHeight}function showAlert(id){const def=ALERT_DEFS[id],title=def?def.badge||id:id,desc=def?def.description||{}:{};$("#a_title").textContent=title;$("#a_why").textContent=desc.why||"";$("#a_fp").textContent=desc.fp||"";$("#a_what").textContent=desc.what||"";$("#alertModal").style.display="flex"}function hideAlert(){$("#alertModal").style.display="none"}async function showInfo(pid){const r=await fetch("/api/info/"+pid);$("#infoText").textContent=JSON.stringify(await r.json(),null,2);$("#infoModal").style.display="flex"}function hideInfo(){$("#infoModal").style.display="none"}function badgeClass(id){const def=ALERT_DEFS[id],sev=def?def.severity??1:1;if(sev<=0)return"badge info";if(sev>=3)return"badge alert";if(sev===2)return"badge warn";return"badge info"}function badgeText(id){const def=ALERT_DEFS[id];return def&&def.badge?def.badge:id}function badges(arr){return!arr||!arr.length?"":arr.map(id=>`<span class="${badgeClass(id)}" data-alert="${id}" title="Click para explicación">${badgeText(id)}</span>`).join(" ")}document.addEventListener("click",ev=>{const el=ev.target;if(el?.dataset?.alert)return showAlert(el.dataset.alert);const ip=el?.dataset?.rip;if(ip)return window.open(`https://www.elhacker.net/geolocalizacion.html?host=${encodeURIComponent(ip)}`,"_blank","noopener")});function alertBadgesInline(alerts){if(!alerts||!alerts.length)return"";return alerts.map(a=>badgeText(a)).join(",")}async function refresh(){const r=await fetch("/api/state?since="+encodeURIComponent(lastEventId));const d=await r.json();ALERT_DEFS=d.alert_definitions||{};$("#txLbl").textContent=`TX ${d.net.tx}`;$("#rxLbl").textContent=`RX ${d.net.rx}`;hist=d.net_history||[];marks=d.net_marks||[];drawChart();(d.events||[]).forEach(e=>{if((e.id||0)>lastEventId)lastEventId=e.id||lastEventId;const remote=e.rip?`${e.rip}:${e.rport}`:"";const k=e.type==="OPEN"?"OPEN ":"CLOSE";logLine(`[${e.t}] ${k} LPort ${e.port} PID ${e.pid} ${e.name||"(?)"} ${e.status||""} ${remote}`.trim());if(unlocked&&e.type==="OPEN")snd.play().catch(()=>{})});(d.alert_events||[]).forEach(e=>{const remote=e.rip?`${e.rip}:${e.rport}`:"";const k=e.type==="OPEN"?"OPEN ":"CLOSE";const al=alertBadgesInline(e.alerts||[]);alertLogLine(`[${e.t}] ALERT ${k} LPort ${e.port} PID ${e.pid} ${e.name||"(?)"} ${e.status||""} ${remote} [${al}]`.trim())});const tb=$("#rows");tb.innerHTML="";for(const p of d.ports||[]){const tr=document.createElement("tr");if(p.severity===3)tr.classList.add("sev3");else if(p.severity===2)tr.classList.add("sev2");const isNew=!p.self&&(d.opened||[]).find(o=>o.pid===p.pid&&o.port===p.port&&(o.rip||"")===(p.rip||"")&&(o.rport||0)===(p.rport||0));if(isNew)tr.classList.add("new");const remoteTxt=p.rip?`${p.rip}:${p.rport}`:p.status==="LISTEN"?"(listen)":"(local)";const remoteCell=p.rip?`<a class="remoteLink" href="javascript:void(0)" data-rip="${p.rip}" title="Geolocalizar">${remoteTxt}</a>`:`<span title="${remoteTxt}">${remoteTxt}</span>`;const dirClass=p.dir==="OUT"?"dirCell dir-out":p.dir==="IN"?"dirCell dir-in":"dirCell dir-listen";const rssTxt=p.rss_mb==null?"-":Number(p.rss_mb).toFixed(1);const procColor=colorFor(p.name||"(?)");const userCls=p.user==="root"?"userRoot":"";tr.innerHTML=`<td>${p.port}</td><td>${p.pid}</td><td title="RSS (MB) memoria residente">${rssTxt}</td><td title="${p.name}" style="color:${procColor}">${p.name}</td><td title="${p.parent||""}">${p.parent||""}</td><td title="${remoteTxt}">${remoteCell}</td><td class="${dirClass}">${p.dir}</td><td class="status-${p.status}">${p.status}</td><td>${p.age_txt}</td><td class="${userCls}">${p.user}</td><td title="${p.exe||""}">${p.exe_short||""}</td><td>${badges(p.alerts)}</td><td><button onclick="showInfo(${p.pid})">Info</button> <button onclick="fetch('/api/kill',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({pid:${p.pid}})})">Kill</button></td>`;tb.appendChild(tr)}}setInterval(refresh,2000);refresh();</script><div style="margin-top:10px;font-size:11px;color:#aaa;text-align:center">Taskport es un ejercicio de programación de <b style="color:#eee">JCRueda</b>. <a href="https://github.com/disketteomelette" target="_blank" rel="noopener" style="color:#fff;text-decoration:none;border-bottom:1px dotted #555">GitHub</a>. Licenciado bajo MIT-TAL.</div></body></html>
+HTML=r"""<!doctype html><html><head><meta charset="utf-8"><title>Taskport</title><style>body{background:#0d0d0d;color:#eee;font-family:system-ui;font-size:12px;margin:10px}.header{display:flex;align-items:center;gap:10px;margin-bottom:6px}h2{margin:0;font-size:16px}.tag{padding:2px 8px;border-radius:999px;font-size:11px;border:1px solid transparent}.tag.tx{color:#0ff;border-color:#0ff}.tag.rx{color:#ff9ecb;border-color:#ff9ecb}#netWrap{position:relative;margin-bottom:8px}#netChart{width:100%;height:100px;background:#000;border:1px solid #222;display:block}#tip{position:absolute;display:none;pointer-events:none;background:#000;border:1px solid #333;color:#eee;font:11px ui-monospace,monospace;padding:4px 6px;white-space:pre}table{width:100%;border-collapse:collapse;table-layout:fixed}th,td{text-align:left;padding:2px 6px;border-bottom:1px solid #222;white-space:nowrap;overflow:hidden;text-overflow:ellipsis}th{background:#1a1a1a;font-weight:600}tr.new{background:#444;animation:fade 1.5s forwards}@keyframes fade{to{background:#0d0d0d}}tr.sev3 td{border-left:3px solid #a55}tr.sev2 td{border-left:3px solid #7a4}td.dirCell{position:relative;padding-left:10px}td.dirCell::before{content:"";position:absolute;left:0;top:0;bottom:0;width:4px;background:#666}td.dir-out::before{background:#0ff}td.dir-in::before{background:#ff9ecb}td.dir-listen::before{background:#666}.badge{display:inline-block;padding:1px 6px;border:1px solid #333;border-radius:999px;font-size:11px;cursor:pointer;margin-right:4px;user-select:none}.badge.warn{border-color:#7a4;color:#cfc}.badge.alert{border-color:#a55;color:#fbb}.badge.info{border-color:#5fa9ff;color:#b7dcff}.status-LISTEN{color:#7fdfff}.status-ESTABLISHED{color:#7fff7f}.status-CLOSE_WAIT,.status-TIME_WAIT{color:#ffbf7f}.status-SYN_SENT,.status-SYN_RECV{color:#ffd27f}button{background:#333;color:#eee;border:none;padding:2px 6px;border-radius:6px}button:hover{background:#444}#log,#alertlog{height:160px;background:#000;font-family:ui-monospace,SFMono-Regular,Menlo,Monaco,Consolas,"Liberation Mono",monospace;font-size:11px;line-height:1.35;overflow:auto;white-space:pre;border:1px solid #222;padding:6px}#log{color:#0ff}#alertlog{color:#ff9800}.modal{position:fixed;inset:0;background:rgba(0,0,0,.7);display:none;align-items:center;justify-content:center;z-index:999}.modal-content{background:#111;padding:14px;width:min(920px,92vw);border:1px solid #222;border-radius:12px}pre{margin:0;overflow:auto;max-height:70vh;font-size:12px}.box{border:1px solid #222;border-radius:10px;padding:10px;margin:8px 0;background:#0f0f0f}.label{color:#aaa;font-size:11px;margin-bottom:4px}a.remoteLink{color:#b7dcff;text-decoration:none;border-bottom:1px dotted #5fa9ff}a.remoteLink:hover{border-bottom:1px solid #5fa9ff}.userRoot{color:#ffeb3b}</style></head><body><div class="header"><h2>Taskport</h2><span class="tag tx" id="txLbl">TX 0.0 B/s</span><span class="tag rx" id="rxLbl">RX 0.0 B/s</span></div><div id="netWrap"><canvas id="netChart"></canvas><div id="tip"></div></div><table><thead><tr><th style="width:48px">LPort</th><th style="width:58px">PID</th><th style="width:64px">RSS</th><th style="width:140px">Proceso</th><th style="width:160px">Padre</th><th style="width:190px">Remoto</th><th style="width:56px">Dir</th><th style="width:108px">Estado</th><th style="width:66px">Age</th><th style="width:150px">TX/RX</th><th style="width:140px">Usuario</th><th style="width:260px">Exe</th><th style="width:240px">Alertas</th><th style="width:116px">Acción</th></tr></thead><tbody id="rows"></tbody></table><h3 style="margin:10px 0 6px 0;font-size:14px">Log</h3><div id="log"></div><h3 style="margin:10px 0 6px 0;font-size:14px">Log alertas</h3><div id="alertlog"></div><div style="display:flex;gap:8px;align-items:center;margin-top:8px"><button onclick="unlock()">Activar sonido</button><audio id="snd" src="/new.wav"></audio></div><div class="modal" id="infoModal"><div class="modal-content"><pre id="infoText"></pre><div style="margin-top:10px;display:flex;gap:8px;justify-content:flex-end"><button onclick="hideInfo()">Cerrar</button></div></div></div><div class="modal" id="alertModal"><div class="modal-content"><h3 id="a_title" style="margin:0 0 8px 0;font-size:14px"></h3><div class="box"><div class="label">Por qué es sospechoso</div><div id="a_why"></div></div><div class="box"><div class="label">Falsos positivos típicos</div><div id="a_fp"></div></div><div class="box"><div class="label">Qué mirar (rápido)</div><div id="a_what"></div></div><div style="margin-top:10px;display:flex;gap:8px;justify-content:flex-end"><button onclick="hideAlert()">Cerrar</button></div></div></div><script>let unlocked=false,ALERT_DEFS={},hist=[],marks=[],procColors=Object.create(null),lastEventId=0;const $=s=>document.querySelector(s),snd=$("#snd"),canvas=$("#netChart"),ctx=canvas.getContext("2d"),tip=$("#tip");const randColor=()=>`hsl(${Math.floor(Math.random()*360)},90%,70%)`,colorFor=n=>procColors[n]||(procColors[n]=randColor());function unlock(){snd.play().catch(()=>{});unlocked=true}function resize(){canvas.width=canvas.clientWidth;canvas.height=canvas.clientHeight}addEventListener("resize",resize);resize();function drawChart(){ctx.clearRect(0,0,canvas.width,canvas.height);if(!hist.length)return;const tx=hist.map(p=>p.tx_bps||0),rx=hist.map(p=>p.rx_bps||0),ts=hist.map(p=>p.t||"");const max=Math.max(1,...tx,...rx),sx=canvas.width/Math.max(1,hist.length-1),sy=canvas.height/max;const line=(arr,color)=>{if(!arr.length)return;ctx.beginPath();ctx.strokeStyle=color;ctx.lineWidth=1.5;arr.forEach((v,i)=>{const x=i*sx,y=canvas.height-(v*sy);i?ctx.lineTo(x,y):ctx.moveTo(x,y)});ctx.stroke()};line(tx,"#0ff");line(rx,"#ff9ecb");marks.forEach(m=>{if(m.i<0||m.i>=hist.length)return;const x=m.i*sx;ctx.strokeStyle=m.color||"#666";ctx.lineWidth=1;ctx.beginPath();ctx.moveTo(x,0);ctx.lineTo(x,canvas.height);ctx.stroke()});ctx.fillStyle="#666";ctx.font="10px ui-monospace,monospace";for(let i=0;i<ts.length;i++)if(i%30===0){const x=i*sx;ctx.save();ctx.translate(x,canvas.height-2);ctx.rotate(-Math.PI/4);ctx.fillText(ts[i],0,0);ctx.restore()}}function idxFromMouse(ev){if(!hist.length)return-1;const r=canvas.getBoundingClientRect(),x=ev.clientX-r.left;const i=Math.round(x/canvas.width*(hist.length-1));return i<0||i>=hist.length?-1:i}function evLine(m){const k=m.ev==="OPEN"||m.kind==="open"?"ABRE":"CIERRA";const r=m.rip?`${m.rip}:${m.rport}`:"(local)";return`${m.t} ${k} LPort ${m.port} PID ${m.pid} ${m.name||"(?)"} -> ${r}`}canvas.addEventListener("mousemove",ev=>{const i=idxFromMouse(ev);if(i<0){tip.style.display="none";return}const tx=hist[i].tx_bps||0,rx=hist[i].rx_bps||0,t=hist[i].t||"";const sx=canvas.width/Math.max(1,hist.length-1),x=i*sx;const evs=marks.filter(m=>m.i===i);const extra=evs.length?"\n"+evs.map(evLine).join("\n"):"";tip.style.display="block";tip.style.left=x+8+"px";tip.style.top="10px";tip.textContent=`${t}\nTX ${tx.toFixed(1)} B/s  RX ${rx.toFixed(1)} B/s${extra}`;drawChart();const max=Math.max(1,...hist.map(p=>p.tx_bps||0),...hist.map(p=>p.rx_bps||0)),sy=canvas.height/max;ctx.fillStyle="#0ff";ctx.beginPath();ctx.arc(x,canvas.height-(tx*sy),2.5,0,Math.PI*2);ctx.fill();ctx.fillStyle="#ff9ecb";ctx.beginPath();ctx.arc(x,canvas.height-(rx*sy),2.5,0,Math.PI*2);ctx.fill()});canvas.addEventListener("mouseleave",()=>{tip.style.display="none";drawChart()});function logLine(s){const d=$("#log");d.textContent+=s+"\n";d.scrollTop=d.scrollHeight}function alertLogLine(s){const d=$("#alertlog");d.textContent+=s+"\n";d.scrollTop=d.scrollHeight}function showAlert(id){const def=ALERT_DEFS[id],title=def?def.badge||id:id,desc=def?def.description||{}:{};$("#a_title").textContent=title;$("#a_why").textContent=desc.why||"";$("#a_fp").textContent=desc.fp||"";$("#a_what").textContent=desc.what||"";$("#alertModal").style.display="flex"}function hideAlert(){$("#alertModal").style.display="none"}async function showInfo(pid){const r=await fetch("/api/info/"+pid);$("#infoText").textContent=JSON.stringify(await r.json(),null,2);$("#infoModal").style.display="flex"}function hideInfo(){$("#infoModal").style.display="none"}function badgeClass(id){const def=ALERT_DEFS[id],sev=def?def.severity??1:1;if(sev<=0)return"badge info";if(sev>=3)return"badge alert";if(sev===2)return"badge warn";return"badge info"}function badgeText(id){const def=ALERT_DEFS[id];return def&&def.badge?def.badge:id}function badges(arr){return!arr||!arr.length?"":arr.map(id=>`<span class="${badgeClass(id)}" data-alert="${id}" title="Click para explicación">${badgeText(id)}</span>`).join(" ")}document.addEventListener("click",ev=>{const el=ev.target;if(el?.dataset?.alert)return showAlert(el.dataset.alert);const ip=el?.dataset?.rip;if(ip)return window.open(`https://www.elhacker.net/geolocalizacion.html?host=${encodeURIComponent(ip)}`,"_blank","noopener")});function alertBadgesInline(alerts){if(!alerts||!alerts.length)return"";return alerts.map(a=>badgeText(a)).join(",")}let ver=0,rulesVer=0,histN=0,clockSkew=0;const NET_MAX={{net_max}},rowsByKey=new Map(),tb=$("#rows");const nowS=()=>Date.now()/1000+clockSkew;function fmtAge(s){s=Math.max(0,Math.floor(s));const z=n=>String(n).padStart(2,"0"),h=Math.floor(s/3600),m=Math.floor(s%3600/60),x=s%60;return h?`${z(h)}:${z(m)}:${z(x)}`:`${z(m)}:${z(x)}`}function humanRate(b){const u=["B/s","KB/s","MB/s","GB/s"];let v=Math.max(0,b||0),i=0;while(v>=1024&&i<u.length-1){v/=1024;i++}return`${v.toFixed(1)} ${u[i]}`}function humanBytes(b){return humanRate(b).replace("/s","")}function ioTitle(p){return p.tx_bps==null?`Proceso: TX ${humanRate(p.proc_tx_bps)} RX ${humanRate(p.proc_rx_bps)}`:`Conexión: TX ${humanBytes(p.tx_bytes)} RX ${humanBytes(p.rx_bytes)} | Proceso: TX ${humanRate(p.proc_tx_bps)} RX ${humanRate(p.proc_rx_bps)}`}function rowHtml(p){const remoteTxt=p.rip?`${p.rip}:${p.rport}`:p.status==="LISTEN"?"(listen)":"(local)";const remoteCell=p.rip?`<a class="remoteLink" href="javascript:void(0)" data-rip="${p.rip}" title="Geolocalizar">${remoteTxt}</a>`:`<span title="${remoteTxt}">${remoteTxt}</span>`;const dirClass=p.dir==="OUT"?"dirCell dir-out":p.dir==="IN"?"dirCell dir-in":"dirCell dir-listen";const rssTxt=p.rss_mb==null?"-":Number(p.rss_mb).toFixed(1);const procColor=colorFor(p.name||"(?)");const userCls=p.user==="root"?"userRoot":"";return`<td>${p.port}</td><td>${p.pid}</td><td title="RSS (MB) memoria residente">${rssTxt}</td><td title="${p.name}" style="color:${procColor}">${p.name}</td><td title="${p.parent||""}">${p.parent||""}</td><td title="${remoteTxt}">${remoteCell}</td><td class="${dirClass}">${p.dir}</td><td class="status-${p.status}">${p.status}</td><td>${fmtAge(nowS()-(p.first_seen||nowS()))}</td><td title="${ioTitle(p)}">${p.tx_bps==null&&p.proc_tx_bps==null?"-":`${humanRate(p.tx_bps??p.proc_tx_bps)} / ${humanRate(p.rx_bps??p.proc_rx_bps)}`}</td><td class="${userCls}">${p.user}</td><td title="${p.exe||""}">${p.exe_short||""}</td><td>${badges(p.alerts)}</td><td><button onclick="showInfo(${p.pid})">Info</button> <button onclick="fetch('/api/kill',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({pid:${p.pid}})})">Kill</button></td>`}function upsertRow(p,isNew){let tr=rowsByKey.get(p.k);if(!tr){tr=document.createElement("tr");rowsByKey.set(p.k,tr)}tr.className="";if(p.severity===3)tr.classList.add("sev3");else if(p.severity===2)tr.classList.add("sev2");if(isNew)tr.classList.add("new");tr.innerHTML=rowHtml(p);tr._p=p;tr._age=tr.children[8]}function rowCmp(a,b){a=a._p;b=b._p;return(b.severity-a.severity)||(a.port-b.port)||(a.pid-b.pid)||(a.rip<b.rip?-1:a.rip>b.rip?1:0)||(a.rport-b.rport)}function updateAges(){for(const tr of rowsByKey.values()){const t=fmtAge(nowS()-(tr._p.first_seen||nowS()));if(tr._age.textContent!==t)tr._age.textContent=t}}function applyState(d){if(d.alert_definitions)ALERT_DEFS=d.alert_definitions;clockSkew=(d.now||Date.now()/1000)-Date.now()/1000;$("#txLbl").textContent=`TX ${d.net.tx}`;$("#rxLbl").textContent=`RX ${d.net.rx}`;if(d.net_reset)hist=[];hist=hist.concat(d.net_history||[]);if(hist.length>NET_MAX)hist=hist.slice(-NET_MAX);if(hist.length)histN=hist[hist.length-1].n;const base=hist.length?hist[0].n:0;marks=marks.concat(d.net_marks||[]);marks.forEach(m=>m.i=m.n-base);marks=marks.filter(m=>m.i>=0);drawChart();(d.events||[]).forEach(e=>{if((e.id||0)>lastEventId)lastEventId=e.id||lastEventId;const remote=e.rip?`${e.rip}:${e.rport}`:"";const k=e.type==="OPEN"?"OPEN ":"CLOSE";logLine(`[${e.t}] ${k} LPort ${e.port} PID ${e.pid} ${e.name||"(?)"} ${e.status||""} ${remote}`.trim());if(unlocked&&e.type==="OPEN")snd.play().catch(()=>{})});(d.alert_events||[]).forEach(e=>{const remote=e.rip?`${e.rip}:${e.rport}`:"";const k=e.type==="OPEN"?"OPEN ":"CLOSE";const al=alertBadgesInline(e.alerts||[]);alertLogLine(`[${e.t}] ALERT ${k} LPort ${e.port} PID ${e.pid} ${e.name||"(?)"} ${e.status||""} ${remote} [${al}]`.trim())});if(d.full){for(const tr of rowsByKey.values())tr.remove();rowsByKey.clear();(d.ports||[]).forEach(p=>upsertRow(p,false))}else{(d.removed||[]).forEach(k=>{const tr=rowsByKey.get(k);if(tr){tr.remove();rowsByKey.delete(k)}});(d.added||[]).forEach(p=>upsertRow(p,!p.self));(d.changed||[]).forEach(p=>upsertRow(p,false))}if(d.full||(d.added||[]).length||(d.changed||[]).length){const rows=[...rowsByKey.values()].sort(rowCmp);rows.forEach((tr,i)=>{if(tb.children[i]!==tr)tb.insertBefore(tr,tb.children[i]||null)})}updateAges();ver=d.version;rulesVer=d.rules_version}const cursor=()=>`v=${ver}&since=${lastEventId}&h=${histN}&rv=${rulesVer}`;async function poll(){try{const r=await fetch("/api/state?"+cursor());applyState(await r.json())}catch(e){}}function connect(){if(!window.EventSource){poll();setInterval(poll,2000);return}const es=new EventSource("/api/stream?"+cursor());es.onmessage=ev=>applyState(JSON.parse(ev.data));es.onerror=()=>{es.close();setTimeout(connect,2000)}}setInterval(updateAges,1000);connect();</script><div style="margin-top:10px;font-size:11px;color:#aaa;text-align:center">Taskport es un ejercicio de programación de <b style="color:#eee">JCRueda</b>. <a href="https://github.com/disketteomelette" target="_blank" rel="noopener" style="color:#fff;text-decoration:none;border-bottom:1px dotted #555">GitHub</a>. Licenciado bajo MIT-TAL.</div></body></html>
 """
 
 @app.route("/")
 def index():
-    return render_template_string(HTML)
+    return render_template_string(HTML,net_max=NET_MAX_POINTS)
+
+def _synthetic_ctx(rng):
+    status=rng.choice(["ESTABLISHED","ESTABLISHED","LISTEN","TIME_WAIT","CLOSE_WAIT","SYN_SENT"])
+    rip="" if status=="LISTEN" else rng.choice(["","127.0.0.1","192.168.1.20","10.0.0.7","8.8.8.8","140.82.112.3","52.1.2.3"])
+    rport=rng.choice([22,53,80,443,3389,5900,7070,8080,4444,6667,31337]) if rip else 0
+    port=rng.choice([22,80,443,1010,5432,8000,49200,51515,rng.randint(1024,65535)])
+    exe=rng.choice(["/usr/bin/curl","/usr/sbin/sshd","/usr/lib/firefox/firefox","/home/u/.cache/x","/tmp/.x/a","/opt/app/bin/app",""])
+    name=rng.choice(["curl","sshd","firefox","apt","chronyd","python3","nc","a","dockerd"])
+    return {"pid":rng.randint(100,60000),"name":name,"user":rng.choice(["root","root","u","www-data",""]),"exe_path":exe,"exe_missing":not exe,
+            "exe_standard":exe.startswith(STANDARD_EXE_PREFIXES),"lip":"0.0.0.0" if status=="LISTEN" else "192.168.1.5","port":port,"rip":rip,"rport":rport,
+            "status":status,"dir":"LISTEN" if status=="LISTEN" else ("OUT" if rip else "IN"),"age_s":rng.uniform(0,1500),"fanout":rng.randint(1,60),
+            "self":port==SELF_PORT or rport==SELF_PORT,"ip_publica":bool(rip and is_public_ip(rip))}
+
+def bench_rules(n=20000,seed=1):
+    rng=random.Random(seed); ctxs=[_synthetic_ctx(rng) for _ in range(n)]
+    t0=time.perf_counter(); ref=[apply_rules_fixpoint(c) for c in ctxs]
+    t1=time.perf_counter(); got=[apply_rules(c) for c in ctxs]
+    t2=time.perf_counter()
+    bad=sum(1 for a,b in zip(ref,got) if a!=b)
+    print(f"reglas={len(RULES)} conexiones={n} plan={'ordenado' if RULE_PLAN['ordered'] else 'iterativo'}")
+    print(f"fixpoint: {(t1-t0)*1000:.1f} ms ({(t1-t0)/n*1e6:.2f} us/conn)")
+    print(f"compilado: {(t2-t1)*1000:.1f} ms ({(t2-t1)/n*1e6:.2f} us/conn)  x{(t1-t0)/max(1e-9,t2-t1):.1f}")
+    print(f"discrepancias: {bad}")
+    return bad
+
+def _hex_addr(ip,port):
+    b=socket.inet_pton(socket.AF_INET6 if ":" in ip else socket.AF_INET,ip)
+    if sys.byteorder=="little": b=b"".join(b[i:i+4][::-1] for i in range(0,len(b),4))
+    return f"{b.hex().upper()}:{port:04X}"
+
+SYNTH_PROCS=(("sshd","/usr/sbin/sshd",0),("chronyd","/usr/sbin/chronyd",0),("dockerd","/usr/bin/dockerd",0),("curl","/usr/bin/curl",1000),
+             ("firefox","/usr/lib/firefox/firefox",1000),("python3","/usr/bin/python3",1000),("a.out","/home/u/.cache/a.out",1000),("nc","/tmp/.x/nc",0))
+
+def _write_proc(root,pid,ppid,name,exe,uid,starttime):
+    base=f"{root}/{pid}"; os.makedirs(f"{base}/fd",exist_ok=True)
+    with open(f"{base}/stat","w",encoding="ascii") as f: f.write(f"{pid} ({name}) S {ppid} {pid} {pid} 0 -1 4194560 100 0 0 0 12 5 0 0 20 0 1 0 {starttime} 10485760 2560"+" 0"*30+"\n")
+    with open(f"{base}/status","w",encoding="ascii") as f: f.write(f"Name:\t{name}\nPPid:\t{ppid}\nUid:\t{uid}\t{uid}\t{uid}\t{uid}\nGid:\t{uid}\t{uid}\t{uid}\t{uid}\n")
+    with open(f"{base}/cmdline","w",encoding="ascii") as f: f.write(f"{exe}\0--synthetic\0")
+    with open(f"{base}/statm","w",encoding="ascii") as f: f.write("2560 640 100 10 0 500 0\n")
+    with open(f"{base}/io","w",encoding="ascii") as f: f.write(f"rchar: {pid*1000}\nwchar: {pid*700}\n")
+    os.symlink(exe,f"{base}/exe")
+
+def build_proc_fixture(root,n,seed=1,per_pid=40,procs=False):
+    rng=random.Random(seed); tables={name:[] for name,_,_ in PROC_NET_TABLES}; states=list(TCP_STATUSES)[:11]
+    os.makedirs(f"{root}/net",exist_ok=True)
+    if procs:
+        with open(f"{root}/stat","w",encoding="ascii") as f: f.write(f"cpu 1 1 1 1 0 0 0 0 0 0\nbtime {int(time.time())-86400}\n")
+        _write_proc(root,1,0,"init","/sbin/init",0,1)
+    for i in range(n):
+        pid=1000+i//per_pid; ino=str(100000+i); fd=f"{root}/{pid}/fd"
+        if i%per_pid==0:
+            if procs: name,exe,uid=SYNTH_PROCS[pid%len(SYNTH_PROCS)]; _write_proc(root,pid,1,name,exe,uid,100+pid)
+            os.makedirs(fd,exist_ok=True)
+            for k in range(4): os.symlink("/dev/null",f"{fd}/{k}")
+        os.symlink(f"socket:[{ino}]",f"{fd}/{10+i%per_pid}")
+        name=rng.choice(["tcp","tcp","tcp6","udp","udp6"]); v6=name.endswith("6")
+        lip=rng.choice(["::","::1","fe80::1"]) if v6 else rng.choice(["0.0.0.0","127.0.0.1","192.168.1.5"])
+        rip=rng.choice(["::","2001:db8::7"]) if v6 else rng.choice(["0.0.0.0","8.8.8.8","10.0.0.7"])
+        st=rng.choice(states) if name.startswith("tcp") else "07"
+        tables[name].append(f"{len(tables[name])}: {_hex_addr(lip,rng.randint(1,65535))} {_hex_addr(rip,0 if rip in ('::','0.0.0.0') else rng.randint(1,65535))} {st} 00000000:00000000 00:00000000 00000000  1000        0 {ino} 1 0000000000000000 20 4 30 10 -1")
+    for name,lines in tables.items():
+        with open(f"{root}/net/{name}","w",encoding="ascii") as f: f.write("  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode\n"+"\n".join(lines)+"\n")
+
+def synthetic_rules(n,seed=1):
+    with open(RULES_PATH,"r",encoding="utf-8") as f: base=[r for r in json.load(f).get("rules",[]) if r.get("enabled",True) and r.get("id")]
+    rng=random.Random(seed); out=list(base[:n])
+    leaves=(lambda: {"field":"status","op":"eq","value":rng.choice(["ESTABLISHED","LISTEN","TIME_WAIT"])},
+            lambda: {"field":"rport","op":"in","value":rng.sample([22,25,53,80,443,3389,4444,5900,6667,8080],3)},
+            lambda: {"field":"port","op":"gte","value":rng.randint(1024,60000)},
+            lambda: {"field":"fanout","op":"gte","value":rng.randint(2,60)},
+            lambda: {"field":"age_s","op":"gte","value":rng.choice([30,60,300,600])},
+            lambda: {"field":"user","op":"eq","value":rng.choice(["root","1000"])},
+            lambda: {"field":"exe_path","op":"starts_with","value":rng.choice(["/home/","/tmp/","/usr/"])},
+            lambda: {"field":"dir","op":"eq","value":rng.choice(["IN","OUT","LISTEN"])},
+            lambda: {"field":"name","op":"in","value":rng.sample([p[0] for p in SYNTH_PROCS],2)},
+            lambda: {"field":"opens_5m","op":"gte","value":rng.randint(5,100)},
+            lambda: {"field":"proc_tx_bps","op":"gt","value":rng.choice([1024,65536])})
+    for i in range(len(out),n):
+        when=[rng.choice(leaves)() for _ in range(rng.randint(1,4))]
+        if out and rng.random()<0.3: when.append({"field":"alerts","op":"contains","value":rng.choice(out)["id"]})
+        if rng.random()<0.2: when=[{"not":when.pop()}]+when
+        out.append({"id":f"synth_{i}","severity":rng.randint(0,3),"badge":f"S{i}","when":{"all" if rng.random()<0.7 else "any":when}})
+    return out
+
+def _reset_runtime_state():
+    global last,_last_sigs,STATE,_tw
+    last={}; _last_sigs={}; _tw=_tw_new(); first_seen.clear(); RULE_CACHE.clear(); PROC_META.clear(); STATE_DELTAS.clear(); _addr_cache.clear()
+    _fd_index.update(pids={},inodes={},unresolved=set(),full_t=0.0,stat_size=None,scans=0); _acct.update(conn={},pid={},io={})
+    with state_lock: STATE={"version":0,"time":now_ts(),"ports":(),"opened":(),"closed":()}
+    with metrics_lock: METRICS["stages"].clear(); METRICS["counters"].clear()
+
+def bench_poll(sizes,rule_counts,iterations=3,seed=1):
+    global PROC_ROOT,_bg_started
+    _bg_started=True; saved=(PROC_ROOT,psutil.PROCFS_PATH); client=app.test_client(); rng=random.Random(seed)
+    print(f"{'sockets':>8} {'reglas':>6} {'snap frío':>10} {'snap':>9} {'fixpoint':>10} {'compilado':>10} {'state':>9} {'KB':>8} {'delta':>8} {'KB':>6}")
+    try:
+        for n in sizes:
+            root=tempfile.mkdtemp(prefix="taskport_poll_")
+            try:
+                build_proc_fixture(root,n,seed=seed,procs=True); PROC_ROOT=root; psutil.PROCFS_PATH=root
+                ctxs=[_synthetic_ctx(rng) for _ in range(min(n,20000))]
+                for r in rule_counts:
+                    install_rules(synthetic_rules(r,seed)); _reset_runtime_state()
+                    t0=time.perf_counter(); collect_state(); cold=time.perf_counter()-t0
+                    t0=time.perf_counter()
+                    for _ in range(iterations): collect_state()
+                    warm=(time.perf_counter()-t0)/iterations
+                    t0=time.perf_counter()
+                    for c in ctxs: apply_rules_fixpoint(c)
+                    t1=time.perf_counter()
+                    for c in ctxs: apply_rules(c)
+                    t2=time.perf_counter()
+                    t3=time.perf_counter(); full=client.get("/api/state").get_data()
+                    t4=time.perf_counter(); delta=client.get(f"/api/state?v={STATE['version']-1}&since={EVENT_SEQ}&rv={RULES_VERSION}").get_data(); t5=time.perf_counter()
+                    print(f"{n:>8} {r:>6} {cold*1000:>8.1f}ms {warm*1000:>7.1f}ms {(t1-t0)/len(ctxs)*1e6:>7.2f}us {(t2-t1)/len(ctxs)*1e6:>7.2f}us "
+                          f"{(t4-t3)*1000:>7.1f}ms {len(full)/1024:>8.1f} {(t5-t4)*1000:>6.1f}ms {len(delta)/1024:>6.1f}")
+                with metrics_lock: stages={k:v[1]/max(1,v[2]) for k,v in METRICS["stages"].items()}
+                print("   etapas (ms medios, última combinación): "+" ".join(f"{k}={v:.1f}" for k,v in sorted(stages.items(),key=lambda x:-x[1])))
+            finally:
+                PROC_ROOT,psutil.PROCFS_PATH=saved; shutil.rmtree(root,ignore_errors=True)
+    finally:
+        _reset_runtime_state(); load_rules()
+    return 0
+
+def bench_proc(sizes):
+    global PROC_ROOT
+    bad=0; saved=(PROC_ROOT,psutil.PROCFS_PATH)
+    for n in sizes:
+        root=tempfile.mkdtemp(prefix="taskport_proc_")
+        try:
+            build_proc_fixture(root,n); PROC_ROOT=root; psutil.PROCFS_PATH=root
+            _fd_index.update(pids={},inodes={},unresolved=set(),full_t=0.0,stat_size=None,scans=0)
+            t0=time.perf_counter(); ref=psutil.net_connections(kind="inet"); ref2=psutil.net_connections(kind="inet")
+            t1=time.perf_counter(); cold=proc_net_connections()
+            t2=time.perf_counter(); warm=proc_net_connections()
+            t3=time.perf_counter()
+            norm=lambda conns: sorted((tuple(c.laddr),tuple(c.raddr),c.status,c.pid) for c in conns)
+            ok=norm(ref)==norm(cold)==norm(warm); bad+=not ok
+            print(f"sockets={n}: psutil x2 {(t1-t0)*1000:.1f} ms | nativo frío {(t2-t1)*1000:.1f} ms | nativo incremental {(t3-t2)*1000:.1f} ms | {'ok' if ok else 'DISCREPANCIA'}")
+        finally:
+            PROC_ROOT,psutil.PROCFS_PATH=saved; shutil.rmtree(root,ignore_errors=True)
+    _fd_index.update(pids={},inodes={},unresolved=set(),full_t=0.0,stat_size=None,scans=0)
+    return bad
 
 if __name__=="__main__":
+    ap=argparse.ArgumentParser(description="Taskport")
+    ap.add_argument("--bench-rules",type=int,metavar="N",help="compara fixpoint vs plan compilado sobre N conexiones sintéticas y sale")
+    ap.add_argument("--bench-proc",nargs="*",type=int,metavar="N",help="compara /proc/net nativo vs psutil con fixtures sintéticos de N sockets (por defecto 1000 10000 50000) y sale")
+    ap.add_argument("--bench-poll",action="store_true",help="mide snapshot(), ambos motores de reglas y /api/state contra conexiones y procesos sintéticos y sale")
+    ap.add_argument("--sockets",nargs="+",type=int,default=[100,1000,10000],metavar="N",help="tamaños para --bench-poll (100 a 100000)")
+    ap.add_argument("--rules",nargs="+",type=int,default=[10,100,500],metavar="R",help="número de reglas para --bench-poll (10 a 500)")
+    ap.add_argument("--iterations",type=int,default=3,help="sondeos en caliente por combinación en --bench-poll")
+    args=ap.parse_args()
+    if args.bench_rules: sys.exit(1 if bench_rules(args.bench_rules) else 0)
+    if args.bench_poll: sys.exit(bench_poll(args.sockets,args.rules,args.iterations))
+    if args.bench_proc is not None: sys.exit(1 if bench_proc(args.bench_proc or [1000,10000,50000]) else 0)
+    start_background()
     app.run("127.0.0.1", SELF_PORT, debug=False)